@@ -1,6 +1,8 @@
 import logging
 import os
 import shutil
+import time
+import uuid
 
 import extra_streamlit_components as stx
 import streamlit as st
@@ -11,71 +13,108 @@ load_dotenv()
 from auth_helpers import (
     init_session_state,
     restore_session_from_cookie,
+    write_pending_cookie,
+    finish_cookie_restore,
     restore_adapter_from_state,
     render_login_flow,
     logout_user,
 )
-from chat_helpers import run_chat_ui
 from config import SYSTEM_PROMPT, DEV_MODE
-from llm_tools import (
-    fetch_user_context,
-    read_training_data,
-    create_and_upload_plan,
-    get_fitness_metrics,
-    get_sidebar_stats,
-)
-from ui_helpers import render_sidebar, friendly_error
+from ui_helpers import inject_css, render_sidebar, friendly_error
 
 if DEV_MODE:
     logging.basicConfig(level=logging.INFO,)
 
 
+# Sidebar stats are reused per user for 15 minutes - VO2max, mileage and readiness change
+# slowly. An all-empty result (new account, or Garmin unreachable) is retried sooner.
+SIDEBAR_STATS_SECONDS = 900
+EMPTY_SIDEBAR_STATS_SECONDS = 120
+
+
+@st.cache_resource(show_spinner=False)
+def _sidebar_stats_store():
+    """{user_key: (fetched_at, stats)}, shared across sessions and reruns."""
+    return {}
+
+
+def _sidebar_key():
+    return st.session_state.get("user_id") or st.session_state.garmin_user
+
+
+def _sidebar_stats():
+    store = _sidebar_stats_store()
+    user_key = _sidebar_key()
+    entry = store.get(user_key)
+    if entry is not None:
+        fetched_at, stats = entry
+        max_age = SIDEBAR_STATS_SECONDS if any(stats.values()) else EMPTY_SIDEBAR_STATS_SECONDS
+        if time.monotonic() - fetched_at < max_age:
+            return stats
+    # langchain-backed modules are imported on first use, so the API-key and login
+    # screens render without paying their import cost
+    from llm_tools import get_sidebar_stats
+    stats = get_sidebar_stats()
+    store[user_key] = (time.monotonic(), stats)
+    return stats
+
+
+def _refresh_context():
+    from chat_helpers import refresh_user_context
+    _sidebar_stats_store().pop(_sidebar_key(), None)
+    refresh_user_context()
+
+
 if not os.path.exists(".env") and os.path.exists("env.example"):
     shutil.copy("env.example", ".env")
 
 st.set_page_config(page_title="Garmin AI Coach", page_icon="🏃", layout="wide")
 
-st.markdown("""
-<style>
-    /* Main content text */
-    .stMarkdown, .stText, p, li {
-        font-size: 1.1rem !important;
-    }
-    
-    /* Chat messages */
-    .stChatMessage p {
-        font-size: 1.15rem !important;
-        line-height: 1.6 !important;
-    }
-    
-    /* Input fields */
-    .stTextInput input, .stTextArea textarea {
-        font-size: 1.1rem !important;
-    }
-    
-    /* Buttons */
-    .stButton button {
-        font-size: 1.1rem !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+inject_css()
 
 st.title("🏃 Garmin AI Running Coach")
 
-cookie_manager = stx.CookieManager(key="garmin_cookies")
+# Per-session component key: a constant key lets sessions share one cookie component's state
+if "_cm_key" not in st.session_state:
+    st.session_state._cm_key = f"garmin_cookies_{uuid.uuid4().hex}"
+cookie_manager = stx.CookieManager(key=st.session_state._cm_key)
 
 init_session_state()
-restore_session_from_cookie(cookie_manager)
+write_pending_cookie(cookie_manager)
+# Session-state adapter first: cheap, and skips the cookie/disk lookup when it succeeds
 restore_adapter_from_state()
+restore_session_from_cookie(cookie_manager)
 
-api_ready = render_sidebar(get_sidebar_stats, lambda: logout_user(cookie_manager))
+api_ready = render_sidebar(
+    _sidebar_stats,
+    lambda: logout_user(cookie_manager),
+    on_refresh=_refresh_context,
+)
 
 if not api_ready:
     st.info("👈 Please enter your OpenAI API key in the sidebar to get started.")
 elif not st.session_state.garmin_connected:
-    render_login_flow(cookie_manager)
+    if not finish_cookie_restore(cookie_manager):
+        render_login_flow()
 else:
-    tools = [fetch_user_context, read_training_data, get_fitness_metrics, create_and_upload_plan]
+    from chat_helpers import run_chat_ui
+    from llm_tools import (
+        fetch_user_context,
+        read_training_data,
+        create_and_upload_plan,
+        get_fitness_metrics,
+        load_full_payload,
+        search_chat_history,
+    )
+
+    tools = [
+        fetch_user_context,
+        read_training_data,
+        get_fitness_metrics,
+        create_and_upload_plan,
+        load_full_payload,
+        search_chat_history,
+    ]
     run_chat_ui(
         system_prompt=SYSTEM_PROMPT,
         dev_mode=DEV_MODE,
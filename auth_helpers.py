@@ -1,79 +1,196 @@
+import hashlib
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
+from functools import partial
 
 import streamlit as st
 
-from config import DEV_MODE
-from garmin import attempt_garmin_login
-from garmin.adapter import GarminAdapter
-from llm_tools import set_adapter
+from config import DEV_MODE, LOGIN_TIMEOUT, dev_log
 from ui_helpers import friendly_error
 from user_storage import (
     save_conversation_by_id,
     get_user_id,
-    load_garmin_token_by_id,
     load_conversation_by_id,
-    load_garmin_username_by_id,
+    load_garmin_session_by_id,
+    save_garmin_token_by_id,
 )
 
 logger = logging.getLogger(__name__)
+_log = partial(dev_log, logger)
 
+# A successful liveness probe is trusted for this long, even past the token's expiry
+SESSION_VERIFY_SECONDS = 60
 
-def _log(level, message):
-    if DEV_MODE:
-        logger.log(level, message)
+# Cookie-restore logins run here so the page shell renders before the Garmin round-trip
+_restore_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cookie-restore")
+
+
+# Session keys every rerun relies on; "messages" gets a fresh list per session
+_SESSION_DEFAULTS = (
+    ("garmin_connected", False),
+    ("garmin_user", None),
+    ("awaiting_mfa", False),
+)
 
 
 def init_session_state():
     """Ensure required session keys exist with sensible defaults."""
-    defaults = {
-        "garmin_connected": False,
-        "garmin_user": None,
-        "awaiting_mfa": False,
-        "messages": [],
-    }
-    for key, value in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = value
+    state = st.session_state
+    # One lookup per rerun; the defaults are only ever set once per session (logout
+    # clears the whole state, sentinel included)
+    if state.get("_initialized"):
+        return
+    for key, value in _SESSION_DEFAULTS:
+        state.setdefault(key, value)
+    if "messages" not in state:
+        state.messages = []
+    state._initialized = True
+
+
+@st.cache_resource(ttl=3600, max_entries=100, show_spinner=False)
+def _restored_adapter(user_id, token_hash, _saved_token):
+    """
+    Log in from saved tokens once per user and share the adapter across browser sessions.
+
+    Reusing the adapter keeps its garth HTTP session (and pooled TLS connections) alive
+    instead of building a new client on every cookie restore. Keyed on the token hash,
+    so a fresh login with new tokens builds a new adapter; failures are not cached.
+    """
+    from garmin.adapter import GarminAdapter
+
+    adapter = GarminAdapter(garth_tokens=_saved_token)
+    adapter.login()
+    return adapter
+
+
+@st.cache_resource(ttl=86400, max_entries=1000, show_spinner=False)
+def _saved_login(user_id):
+    """
+    Saved (garth tokens, username) for a user, read from storage once per process.
+
+    Cleared whenever the stored tokens may change (login, logout), since entries
+    would otherwise outlive a token rewrite.
+    """
+    return load_garmin_session_by_id(user_id)
 
 
 def restore_session_from_cookie(cookie_manager):
-    """Restore a logged-in session from a stored cookie if possible."""
-    if st.session_state.garmin_connected:
+    """Start restoring a logged-in session from a stored cookie (see finish_cookie_restore)."""
+    if st.session_state.garmin_connected or st.session_state.get("_cookie_checked"):
         return False
 
-    all_cookies = cookie_manager.get_all()
-    _log(logging.INFO, f"🍪 All cookies: {all_cookies}")
     saved_user_id = cookie_manager.get("garmin_user_id")
-    _log(logging.INFO, f"🍪 Cookie read: garmin_user_id = {saved_user_id}")
+    _log(logging.INFO, "🍪 Cookie read: garmin_user_id = %s", saved_user_id)
 
     if not saved_user_id:
         return False
+    # A cookie was read - attempt the restore once per session, not on every rerun
+    st.session_state._cookie_checked = True
 
-    saved_token = load_garmin_token_by_id(saved_user_id)
-    saved_username = load_garmin_username_by_id(saved_user_id)
+    saved_token, saved_username = _saved_login(saved_user_id)
     if not saved_token:
         return False
 
+    token_hash = hashlib.sha1(saved_token.encode()).hexdigest()
+    st.session_state._restore_future = _restore_pool.submit(_restored_adapter, saved_user_id, token_hash, saved_token)
+    st.session_state._restore_user = (saved_user_id, saved_username)
+    return False
+
+
+def finish_cookie_restore(cookie_manager):
+    """
+    Complete a cookie-restore login started by restore_session_from_cookie.
+
+    Called after the sidebar and title have rendered, so the Garmin login only blocks
+    the part of the page that needs it. Reruns into the chat on success.
+    """
+    future = st.session_state.pop("_restore_future", None)
+    if future is None:
+        return False
+    saved_user_id, saved_username = st.session_state.pop("_restore_user")
+
     try:
-        adapter = GarminAdapter(garth_tokens=saved_token)
-        adapter.login()
-        _log(logging.INFO, f"✅ Restored session from cookie for user {saved_user_id[:8]}...")
+        with st.spinner("Restoring your Garmin session..."):
+            adapter = future.result(timeout=LOGIN_TIMEOUT)
+            _log(logging.INFO, "✅ Restored session from cookie for user %.8s...", saved_user_id)
+            # adapter.full_name only makes a request if neither the save nor the login had it
+            st.session_state.garmin_user = saved_username or adapter.full_name or "User"
         st.session_state.garmin_connected = True
-        st.session_state.garmin_user = saved_username or adapter.client.get_full_name() or "User"
         st.session_state.user_id = saved_user_id
         st.session_state.garmin_adapter = adapter
-        set_adapter(adapter)
+        _mark_session_valid(adapter)
+        _share_adapter(adapter)
+        _prefetch_user_context(saved_user_id, adapter)
+        if adapter.tokens_refreshed:
+            # Save the refreshed OAuth2 token so the next restore doesn't refresh again
+            save_garmin_token_by_id(saved_user_id, adapter.get_tokens(), username=saved_username or adapter.full_name)
+            adapter.tokens_refreshed = False
+            _saved_login.clear()
 
         saved_messages = load_conversation_by_id(saved_user_id)
         if saved_messages:
             st.session_state.messages = saved_messages
-        return True
+    except FutureTimeoutError:
+        # Garmin is slow, not the login - keep the cookie so the next visit tries again
+        _log(logging.WARNING, "🍪 Cookie restore timed out after %ss, keeping cookie", LOGIN_TIMEOUT)
+        return False
     except Exception as e:
-        _log(logging.WARNING, f"🍪 Cookie restore FAILED: {e}, deleting cookie")
-        cookie_manager.delete("garmin_user_id")
+        if _is_auth_failure(e):
+            _log(logging.WARNING, "🍪 Cookie restore FAILED: %s, deleting cookie", e)
+            cookie_manager.delete("garmin_user_id")
+        else:
+            _log(logging.WARNING, "🍪 Cookie restore FAILED: %s, keeping cookie", e)
         return False
+    st.rerun()
+
+
+def _is_auth_failure(error):
+    """Whether Garmin rejected the saved login (as opposed to being slow or unreachable)."""
+    # Both modules are already loaded by the restore that raised
+    from garminconnect import GarminConnectAuthenticationError
+    from garmin import MFARequiredError
+    return isinstance(error, (GarminConnectAuthenticationError, MFARequiredError))
+
+
+def _share_adapter(adapter):
+    """Hand the adapter to the LLM tools (imported lazily; pulls in langchain)."""
+    from llm_tools import set_adapter
+    set_adapter(adapter)
+
+
+def _prefetch_user_context(user_id, adapter):
+    """Kick off the Garmin context fetch so it overlaps with the rerun into the chat."""
+    if DEV_MODE:
+        return
+    from chat_helpers import prefetch_user_context
+    prefetch_user_context(user_id, adapter)
+
+
+def _mark_session_valid(adapter):
+    """Remember until when the adapter's OAuth2 token is valid, so reruns can skip the probe."""
+    try:
+        expires_at = adapter.client.garth.oauth2_token.expires_at
+    except AttributeError:
+        expires_at = None
+    st.session_state.garmin_session_expiry = expires_at or time.time() + 3500
+
+
+def _adapter_token_hash(adapter):
+    """Hash of the adapter's session tokens, computed once per login."""
+    cached = st.session_state.get("adapter_token_hash")
+    if cached and cached[0] == id(adapter):
+        return cached[1]
+    token_hash = hashlib.sha1((adapter.get_tokens() or "").encode()).hexdigest()
+    st.session_state.adapter_token_hash = (id(adapter), token_hash)
+    return token_hash
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _probe_session(token_hash, _adapter):
+    """Validate the Garmin session and return the display name (cached briefly)."""
+    return _adapter.client.get_full_name()
 
 
 def restore_adapter_from_state():
@@ -85,28 +202,55 @@ def restore_adapter_from_state():
         return False
 
     adapter = st.session_state.garmin_adapter
+    verified_at = st.session_state.get("verified_at")
+    recently_verified = verified_at is not None and time.monotonic() - verified_at < SESSION_VERIFY_SECONDS
+    if st.session_state.garmin_user and (
+        recently_verified or time.time() < st.session_state.get("garmin_session_expiry", 0)
+    ):
+        # Token not expired (or checked moments ago) - trust the known name without a network probe
+        st.session_state.garmin_connected = True
+        _share_adapter(adapter)
+        return True
+
     try:
+        st.session_state.garmin_user = _probe_session(_adapter_token_hash(adapter), adapter)
+        st.session_state.verified_at = time.monotonic()
         st.session_state.garmin_connected = True
-        st.session_state.garmin_user = adapter.client.get_full_name()
-        set_adapter(adapter)
+        _mark_session_valid(adapter)
+        _share_adapter(adapter)
         return True
     except Exception:
         del st.session_state.garmin_adapter
+        st.session_state.pop("adapter_token_hash", None)
+        st.session_state.pop("garmin_session_expiry", None)
+        st.session_state.pop("verified_at", None)
         st.session_state.garmin_connected = False
         st.session_state.garmin_user = None
         return False
 
 
-def _set_login_cookie(cookie_manager, user_id):
-    """Persist login for future sessions."""
+def _set_login_cookie(user_id):
+    """Persist login for future sessions; the cookie is written on the next run."""
+    # Login handlers st.rerun() straight away, which would drop the cookie component
+    # before the browser stores it - so queue it instead of sleeping before the rerun
+    st.session_state._pending_login_cookie = user_id
+    _saved_login.clear()  # The login just saved fresh tokens
+
+
+def write_pending_cookie(cookie_manager):
+    """Write a login cookie queued by the previous run (see _set_login_cookie)."""
+    user_id = st.session_state.pop("_pending_login_cookie", None)
+    if user_id is None:
+        return
     expire_date = datetime.now() + timedelta(days=30)
     cookie_manager.set("garmin_user_id", user_id, expires_at=expire_date)
-    _log(logging.INFO, f"🍪 Cookie SET: garmin_user_id = {user_id}, expires = {expire_date}")
-    time.sleep(0.5)
+    _log(logging.INFO, "🍪 Cookie SET: garmin_user_id = %s, expires = %s", user_id, expire_date)
 
 
-def render_login_flow(cookie_manager):
+def render_login_flow():
     """Render the Garmin login + MFA flow and update session state."""
+    from garmin import attempt_garmin_login
+
     st.markdown("### Connect to Garmin")
 
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -136,9 +280,11 @@ def render_login_flow(cookie_manager):
                         st.session_state.garmin_user = result
                         user_id = get_user_id(garmin_email, garmin_password)
                         st.session_state.user_id = user_id
-                        _set_login_cookie(cookie_manager, user_id)
+                        _set_login_cookie(user_id)
                         if "garmin_adapter" in st.session_state:
-                            set_adapter(st.session_state.garmin_adapter)
+                            _mark_session_valid(st.session_state.garmin_adapter)
+                            _share_adapter(st.session_state.garmin_adapter)
+                            _prefetch_user_context(user_id, st.session_state.garmin_adapter)
                         st.rerun()
                     elif needs_mfa:
                         st.session_state.awaiting_mfa = True
@@ -177,12 +323,14 @@ def render_login_flow(cookie_manager):
                             st.session_state.awaiting_mfa = False
                             user_id = get_user_id(email, password)
                             st.session_state.user_id = user_id
-                            _set_login_cookie(cookie_manager, user_id)
+                            _set_login_cookie(user_id)
                             for key in ["pending_email", "pending_password", "pending_adapter"]:
                                 if key in st.session_state:
                                     del st.session_state[key]
                             if "garmin_adapter" in st.session_state:
-                                set_adapter(st.session_state.garmin_adapter)
+                                _mark_session_valid(st.session_state.garmin_adapter)
+                                _share_adapter(st.session_state.garmin_adapter)
+                                _prefetch_user_context(user_id, st.session_state.garmin_adapter)
                             st.rerun()
                         else:
                             st.error(f"❌ {friendly_error(result)}")
@@ -202,7 +350,7 @@ def logout_user(cookie_manager):
 
     _log(logging.INFO, "🍪 Cookie DELETE: garmin_user_id (logout)")
     cookie_manager.delete("garmin_user_id")
+    _saved_login.clear()
 
-    for key in list(st.session_state.keys()):
-        del st.session_state[key]
+    st.session_state.clear()
     st.rerun()
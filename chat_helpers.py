@@ -1,11 +1,443 @@
 import asyncio
-from datetime import datetime
+import atexit
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 
+import httpx
 import streamlit as st
-from langchain.agents import create_agent
-from langchain_core.messages import HumanMessage, AIMessage
 
-from user_storage import save_conversation_by_id
+# LangChain (and llm_tools, which pulls in langchain.tools) is imported inside the functions
+# that need it: the login path imports this module for prefetch_user_context only
+from config import AGENT_MODEL, CHAT_HISTORY_WINDOW, CHAT_MEMORY_MESSAGES
+from user_storage import append_message_by_id, append_messages_by_id, archive_messages_by_id
+
+
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def _cached_user_context(user_key, _adapter):
+    """
+    Fetch the Garmin context once per user per 10 minutes instead of on every new session.
+
+    Runs on a pool thread, where st.session_state isn't visible - so the caller passes
+    in this session's adapter rather than letting the tool look one up.
+    """
+    from llm_tools import build_user_context
+    context = build_user_context(_adapter, user_key)
+    if context.startswith("Error fetching Garmin data"):
+        # Raise so the failure is not cached and the next session retries
+        raise RuntimeError(context)
+    return context
+
+
+# Runs the post-login Garmin context fetch while the app reruns into the chat page
+_prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="context-prefetch")
+
+
+def prefetch_user_context(user_key, adapter):
+    """Start loading the Garmin context in the background right after login."""
+    st.session_state.ctx_future = _prefetch_pool.submit(_cached_user_context, user_key, adapter)
+
+
+@st.cache_resource(show_spinner=False)
+def _http_client():
+    """Pooled HTTP client shared by every chat model in the process (keeps TLS connections alive)."""
+    client = httpx.Client(
+        timeout=60,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    atexit.register(client.close)
+    return client
+
+
+@st.cache_resource(show_spinner=False)
+def _async_http_client():
+    """Pooled async client; safe to share because every async call runs on _event_loop()."""
+    return httpx.AsyncClient(
+        timeout=60,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _chat_model(model):
+    """Chat model bound to the shared HTTP clients."""
+    from langchain.chat_models import init_chat_model
+
+    return init_chat_model(
+        model,
+        http_client=_http_client(),
+        http_async_client=_async_http_client(),
+    )
+
+
+# Bounded like _build_agent: one entry per distinct (day, user context)
+@st.cache_data(ttl=86400, max_entries=64, show_spinner=False)
+def _populate_prompt(today, user_context, _system_prompt):
+    """Fill the system prompt once per (day, context) instead of on every new session."""
+    return _system_prompt.substitute(today=today, user_context=user_context)
+
+
+# Bounded: every distinct user context yields its own agent, so cap how many stay alive
+@st.cache_resource(show_spinner=False, max_entries=64, ttl=3600)
+def _build_agent(model, tool_names, prompt_key, _system_prompt, _tools):
+    """
+    Build the LangChain agent once and share it across reruns and sessions.
+    
+    Cached on (model, tool names, sha1 of the populated prompt); the prompt text and
+    tool objects are not hashed by Streamlit, the short key stands in for them.
+    The prompt embeds today's date, so a new agent is built at most once per day.
+    """
+    from langchain.agents import create_agent
+
+    return create_agent(
+        _chat_model(model),
+        tools=_tools,
+        system_prompt=_system_prompt,
+    )
+
+
+def refresh_user_context():
+    """Drop cached Garmin data so the next run re-fetches it and rebuilds the agent."""
+    from llm_tools import clear_cached_context
+
+    _cached_user_context.clear()
+    clear_cached_context(st.session_state.get("user_id"))
+    for key in ("user_context", "agent", "ctx_future"):
+        st.session_state.pop(key, None)
+    st.rerun()
+
+
+def _to_lc_message(message):
+    """Convert a stored chat message dict into a LangChain message."""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    if message["role"] == "user":
+        return HumanMessage(content=message["content"])
+    return AIMessage(content=message["content"])
+
+
+def _chat_history():
+    """
+    Return LangChain messages mirroring st.session_state.messages.
+
+    The converted list is kept in session state and only messages added since the
+    last turn are converted, instead of rebuilding the whole history every prompt.
+    """
+    history = st.session_state.setdefault("lc_messages", [])
+    messages = st.session_state.messages
+    if len(history) > len(messages):
+        history.clear()
+        for key in ("chat_summary", "summarized_upto"):
+            st.session_state.pop(key, None)
+    history.extend(_to_lc_message(msg) for msg in messages[len(history):])
+    return history
+
+
+def _summarize(previous_summary, messages):
+    """Fold messages into the running conversation summary."""
+    from langchain_core.messages import HumanMessage
+
+    transcript = "\n".join(
+        f"{'User' if isinstance(msg, HumanMessage) else 'Coach'}: {msg.content}" for msg in messages
+    )
+    prompt = (
+        "Update the summary of this running-coach conversation. Keep facts the coach needs later: "
+        "injuries, schedule, preferences, goals, agreed plans and workouts already uploaded. "
+        "Reply with the summary only.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+    )
+    return _chat_model(AGENT_MODEL).invoke(prompt).content
+
+
+def _windowed_history(history):
+    """
+    Messages to send to the agent: a running summary plus the recent turns verbatim.
+
+    Older messages are summarized in batches of CHAT_HISTORY_WINDOW, so the summarizer
+    runs every few turns rather than on every prompt. Nothing is dropped unsummarized:
+    if summarizing fails, the extra messages are simply sent as-is.
+    """
+    from langchain_core.messages import SystemMessage
+
+    summarized = st.session_state.get("summarized_upto", 0)
+    cutoff = len(history) - CHAT_HISTORY_WINDOW
+    if cutoff - summarized >= CHAT_HISTORY_WINDOW:
+        try:
+            st.session_state.chat_summary = _summarize(
+                st.session_state.get("chat_summary", ""),
+                history[summarized:cutoff],
+            )
+            st.session_state.summarized_upto = summarized = cutoff
+        except Exception:
+            pass
+
+    summary = st.session_state.get("chat_summary")
+    if not summary:
+        return history[summarized:]
+    return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + history[summarized:]
+
+
+def _append_message(role, content, persist=True):
+    """Add a message to the conversation and (by default) journal just that message to disk."""
+    state = st.session_state
+    messages = state.messages
+    seq = messages[-1].get("seq", len(messages) - 1) + 1 if messages else 0
+    message = {"role": role, "content": content, "seq": seq}
+    messages.append(message)
+    if persist:
+        user_id = state.get("user_id")
+        if user_id is not None:
+            append_message_by_id(user_id, seq, message)
+    return message
+
+
+def _archive_overflow():
+    """
+    Move messages beyond CHAT_MEMORY_MESSAGES to the on-disk archive, keeping caches in sync.
+
+    Only messages already folded into the running summary are archived; the agent would
+    otherwise lose ones that left memory before the summarizer got to them.
+    """
+    messages = st.session_state.messages
+    summarized = st.session_state.get("summarized_upto", 0)
+    overflow = min(len(messages) - max(CHAT_MEMORY_MESSAGES, CHAT_HISTORY_WINDOW), summarized)
+    if overflow <= 0 or "user_id" not in st.session_state:
+        return
+    archive_messages_by_id(st.session_state.user_id, messages[:overflow])
+    del messages[:overflow]
+    history = st.session_state.get("lc_messages")
+    if history:
+        del history[:overflow]
+    st.session_state.summarized_upto = summarized - overflow
+    st.session_state.pop("history_md", None)
+
+
+# Messages at the end of the chat still rendered as individual chat bubbles
+RECENT_BUBBLES = 2
+_ROLE_LABELS = {"user": "🧑 **You**", "assistant": "🏃 **Coach**"}
+
+
+def _history_markdown(messages):
+    """
+    Older messages pre-joined into one markdown string, extended incrementally.
+
+    Rendering them as a single element keeps the per-rerun element count constant
+    instead of one chat bubble per message. Consecutive messages from the same role
+    are grouped under one label.
+    """
+    cached = st.session_state.get("history_md")
+    if cached is None or cached[0] > len(messages):
+        cached = (0, "")
+    count, text = cached
+    if count < len(messages):
+        parts = []
+        for i in range(count, len(messages)):
+            msg = messages[i]
+            if i == 0 or messages[i - 1]["role"] != msg["role"]:
+                if i:
+                    parts.append("---\n\n")
+                parts.append(f"{_ROLE_LABELS.get(msg['role'], msg['role'])}\n\n")
+            parts.append(f"{msg['content']}\n\n")
+        text += "".join(parts)
+        count = len(messages)
+    st.session_state.history_md = (count, text)
+    return text
+
+
+_INTRO_PROMPT = """Introduce yourself as an AI Running Coach. Briefly summarize what you know about the user:
+- Name and current fitness level
+- Training goal (if any race planned)
+- Recent training highlights
+- Key metrics (race predictions, suggested paces)
+
+Keep it concise (8-15 sentences max). 
+
+End with: "Is there anything else I should know about you? (injuries, schedule, preferences) Otherwise, how can I help today?"
+"""
+
+
+# Exact-match answer cache shared by all sessions; keys include the user, their Garmin
+# context and today's date (the system prompt embeds it), so personalized answers never
+# leak across users, data refreshes or days. Entries also expire after an hour
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_CACHE_SECONDS = 3600
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def _response_key(prompt):
+    """Cache key for a prompt: user, date, Garmin context, earlier user turns and the normalized prompt."""
+    user_key = st.session_state.get("user_id") or st.session_state.garmin_user
+    earlier = "\x1e".join(m["content"] for m in st.session_state.messages[:-1] if m["role"] == "user")
+    normalized = " ".join(prompt.lower().split())
+    raw = "\x1f".join(
+        (str(user_key), date.today().isoformat(), st.session_state.user_context, earlier, normalized)
+    )
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _cached_response(key):
+    with _response_cache_lock:
+        entry = _response_cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= RESPONSE_CACHE_SECONDS:
+            del _response_cache[key]
+            return None
+        _response_cache.move_to_end(key)
+        return entry[1]
+
+
+def _store_response(key, answer):
+    with _response_cache_lock:
+        _response_cache[key] = (time.monotonic(), answer)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+# Greeting reuse: the intro only depends on the user's Garmin context and today's date
+INTRO_CACHE_SECONDS = 3600
+_intro_cache = {}
+_intro_cache_lock = threading.Lock()
+
+
+def _intro_key():
+    user_key = st.session_state.get("user_id") or st.session_state.garmin_user
+    raw = f"{user_key}\x1f{date.today().isoformat()}\x1f{st.session_state.user_context}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _cached_intro(key):
+    """Return a greeting generated for the same context within the last hour, if any."""
+    with _intro_cache_lock:
+        entry = _intro_cache.get(key)
+    if entry and time.monotonic() - entry[0] < INTRO_CACHE_SECONDS:
+        return entry[1]
+    return None
+
+
+def _store_intro(key, intro):
+    now = time.monotonic()
+    with _intro_cache_lock:
+        for stale in [k for k, (at, _) in _intro_cache.items() if now - at >= INTRO_CACHE_SECONDS]:
+            del _intro_cache[stale]
+        _intro_cache[key] = (now, intro)
+
+
+@st.cache_resource(show_spinner=False)
+def _event_loop():
+    """One asyncio loop for the whole process, running forever on a daemon thread."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True).start()
+    return loop
+
+
+async def _pump_agent_events(agent, messages, events, tool_session):
+    """Run the agent on the shared loop and forward the events the UI renders."""
+    from llm_tools import use_tool_session
+
+    # Each turn runs as its own task with its own context, so this binding is per-session
+    use_tool_session(*tool_session)
+    try:
+        async for event in agent.astream_events({"messages": messages}, version="v2"):
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                content = event["data"]["chunk"].content
+                if content:
+                    events.put((kind, content))
+            elif kind == "on_tool_start":
+                events.put((kind, event.get("name", "tool")))
+    finally:
+        events.put((None, None))
+
+
+# Minimum interval between placeholder redraws while tokens stream in (~20 updates/sec)
+STREAM_FLUSH_SECONDS = 0.05
+
+
+def _stream_agent_reply(agent, messages):
+    """Stream the agent's reply into the current container; returns (text, whether tools ran)."""
+    events = queue.Queue()
+    # Tools can't read st.session_state from the loop thread, so capture what they need here
+    tool_session = (st.session_state.get("garmin_adapter"), st.session_state.get("user_id"))
+    future = asyncio.run_coroutine_threadsafe(
+        _pump_agent_events(agent, messages, events, tool_session), _event_loop()
+    )
+    response_placeholder = st.empty()
+    full_response = ""
+    status_box = None
+    tools_used = []
+
+    # Streamlit elements may only be touched from the script thread, so drain the queue here
+    last_flush = 0.0
+    pending = False
+    try:
+        while True:
+            try:
+                kind, value = events.get(timeout=STREAM_FLUSH_SECONDS)
+            except queue.Empty:
+                kind = value = ""
+            if kind is None:
+                break
+            if kind == "on_chat_model_stream":
+                full_response += value
+                pending = True
+            elif kind == "on_tool_start":
+                # One status element for the whole reply, relabelled per tool
+                tools_used.append(value)
+                if status_box is None:
+                    status_box = st.status(f"🔧 Using {value}...", state="running")
+                else:
+                    status_box.update(label=f"🔧 Using {value}...")
+            # Batch token deltas: one redraw per interval instead of one per chunk. Plain
+            # text while streaming; markdown is parsed once, after the reply completes.
+            if pending and time.monotonic() - last_flush >= STREAM_FLUSH_SECONDS:
+                response_placeholder.text(full_response + "▌")
+                last_flush = time.monotonic()
+                pending = False
+        future.result()  # Surface agent errors to the caller
+    finally:
+        future.cancel()  # No-op when finished; stops the agent if the script run was interrupted
+
+    if status_box is not None:
+        status_box.update(label=f"🔧 Used {', '.join(dict.fromkeys(tools_used))}", state="complete")
+    response_placeholder.markdown(full_response)
+    return full_response, bool(tools_used)
+
+
+def _render_intro(dev_mode):
+    """Render the opening greeting into the current chat bubble and return its text."""
+    if dev_mode:
+        intro_message = "👋 Hi! I'm your AI Running Coach (DEV MODE). How can I help?"
+        st.markdown(intro_message)
+        return intro_message
+
+    from langchain_core.messages import HumanMessage
+
+    intro_key = _intro_key()
+    intro_message = _cached_intro(intro_key)
+    if intro_message is not None:
+        st.markdown(intro_message)
+        return intro_message
+
+    try:
+        intro_message, _ = _stream_agent_reply(
+            st.session_state.agent,
+            [HumanMessage(content=_INTRO_PROMPT)],
+        )
+    except Exception:
+        intro_message = None
+    if not intro_message:
+        intro_message = "👋 Hi! I'm your AI Running Coach. I've connected to your Garmin data. How can I help?"
+        st.markdown(intro_message)
+        return intro_message
+    _store_intro(intro_key, intro_message)
+    return intro_message
 
 
 def run_chat_ui(system_prompt, dev_mode, tools, friendly_error):
@@ -16,104 +448,80 @@ def run_chat_ui(system_prompt, dev_mode, tools, friendly_error):
         else:
             with st.spinner("Fetching your Garmin data..."):
                 try:
-                    context = tools[0].invoke({})
-                    st.session_state.user_context = context
+                    future = st.session_state.pop("ctx_future", None)
+                    if future is None:
+                        user_key = st.session_state.get("user_id") or st.session_state.garmin_user
+                        future = _prefetch_pool.submit(_cached_user_context, user_key, st.session_state.garmin_adapter)
+                    # Build the chat model (client setup, tool schemas) while Garmin answers
+                    _chat_model(AGENT_MODEL)
+                    st.session_state.user_context = future.result()
                 except Exception as e:
                     st.session_state.user_context = f"Could not load Garmin data: {friendly_error(e)}"
 
     if "agent" not in st.session_state:
         today = datetime.now().strftime("%Y-%m-%d")
-        populated_prompt = system_prompt.format(
-            today=today,
-            user_context=st.session_state.user_context,
-        )
-        st.session_state.agent = create_agent(
-            "openai:gpt-4o-mini",
-            tools=tools,
-            system_prompt=populated_prompt,
+        populated_prompt = _populate_prompt(today, st.session_state.user_context, system_prompt)
+        st.session_state.agent = _build_agent(
+            AGENT_MODEL,
+            tuple(t.name for t in tools),
+            hashlib.sha1(populated_prompt.encode()).hexdigest(),
+            populated_prompt,
+            tools,
         )
 
-        if len(st.session_state.messages) == 0:
-            if dev_mode:
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": "👋 Hi! I'm your AI Running Coach (DEV MODE). How can I help?",
-                })
-            else:
-                with st.spinner("Analyzing your training data..."):
-                    try:
-                        intro_response = st.session_state.agent.invoke({
-                            "messages": [HumanMessage(content="""Introduce yourself as an AI Running Coach. Briefly summarize what you know about the user:
-- Name and current fitness level
-- Training goal (if any race planned)
-- Recent training highlights
-- Key metrics (race predictions, suggested paces)
+    _chat_fragment(dev_mode, friendly_error)
 
-Keep it concise (8-15 sentences max). 
 
-End with: "Is there anything else I should know about you? (injuries, schedule, preferences) Otherwise, how can I help today?"
-""")]
-                        })
-                        intro_message = intro_response["messages"][-1].content
-                        st.session_state.messages.append({"role": "assistant", "content": intro_message})
-                    except Exception:
-                        st.session_state.messages.append({
-                            "role": "assistant",
-                            "content": "👋 Hi! I'm your AI Running Coach. I've connected to your Garmin data. How can I help?",
-                        })
-
-    for message in st.session_state.messages:
+@st.fragment
+def _chat_fragment(dev_mode, friendly_error):
+    """
+    Chat history, input and replies.
+
+    Runs as a fragment, so submitting a prompt reruns only this block - not the
+    cookie/session checks, sidebar and context setup in the rest of the script.
+    """
+    older = st.session_state.messages[:-RECENT_BUBBLES]
+    if older:
+        st.markdown(_history_markdown(older))
+    for message in st.session_state.messages[-RECENT_BUBBLES:]:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
-    if prompt := st.chat_input("How can I help with your training today?"):
-        st.session_state.messages.append({"role": "user", "content": prompt})
+    # The input is pinned to the bottom of the page, so create it before the (possibly
+    # slow) greeting streams in
+    prompt = st.chat_input("How can I help with your training today?")
+
+    # Greet a new conversation once, after the chat shell has rendered
+    if not st.session_state.get("intro_done"):
+        if not st.session_state.messages:
+            with st.chat_message("assistant"):
+                intro_message = _render_intro(dev_mode)
+            _append_message("assistant", intro_message)
+        st.session_state.intro_done = True
 
-        if "user_id" in st.session_state:
-            save_conversation_by_id(st.session_state.user_id, st.session_state.messages)
+    if prompt:
+        user_id = st.session_state.get("user_id")
+        # Journaled together with the reply - a user turn without an answer isn't worth a write
+        user_message = _append_message("user", prompt, persist=False)
 
         with st.chat_message("user"):
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
             try:
-                chat_history = []
-                for msg in st.session_state.messages:
-                    if msg["role"] == "user":
-                        chat_history.append(HumanMessage(content=msg["content"]))
-                    else:
-                        chat_history.append(AIMessage(content=msg["content"]))
-
-                async def stream_agent_events():
-                    response_placeholder = st.empty()
-                    full_response = ""
-                    tool_statuses = {}
-
-                    async for event in st.session_state.agent.astream_events(
-                        {"messages": chat_history},
-                        version="v2",
-                    ):
-                        kind = event["event"]
-                        if kind == "on_chat_model_stream":
-                            content = event["data"]["chunk"].content
-                            if content:
-                                full_response += content
-                                response_placeholder.markdown(full_response + "▌")
-                        elif kind == "on_tool_start":
-                            tool_name = event.get("name", "tool")
-                            tool_statuses[tool_name] = st.status(f"🔧 Using {tool_name}...", state="running")
-                        elif kind == "on_tool_end":
-                            tool_name = event.get("name", "tool")
-                            if tool_name in tool_statuses:
-                                tool_statuses[tool_name].update(state="complete")
-
-                    response_placeholder.markdown(full_response)
-                    return full_response
-
-                output = asyncio.run(stream_agent_events())
-                st.session_state.messages.append({"role": "assistant", "content": output})
-
-                if "user_id" in st.session_state:
-                    save_conversation_by_id(st.session_state.user_id, st.session_state.messages)
+                cache_key = _response_key(prompt)
+                output = _cached_response(cache_key)
+                if output is not None:
+                    st.markdown(output)
+                else:
+                    chat_history = _windowed_history(_chat_history())
+                    output, used_tools = _stream_agent_reply(st.session_state.agent, chat_history)
+                    # Tool calls fetch live data or upload workouts - never replay those answers
+                    if output and not used_tools:
+                        _store_response(cache_key, output)
+                reply = _append_message("assistant", output, persist=False)
+                if user_id is not None:
+                    append_messages_by_id(user_id, [user_message, reply])
+                _archive_overflow()
             except Exception as e:
                 st.error(f"❌ {friendly_error(e)}")
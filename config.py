@@ -3,16 +3,40 @@ Configuration and constants for the Garmin AI Running Coach.
 """
 
 import os
+from string import Template
 
 # Dev mode - skip expensive initial context fetch and greeting
 DEV_MODE = os.getenv("DEV_MODE", "false").lower() == "true"
 
-SYSTEM_PROMPT = """You are an AI Running Coach with access to the user's Garmin data.
 
-TODAY'S DATE: {today}
+def dev_log(logger, level, message, *args):
+    """Log only in dev mode; %-style args are formatted only if the record is emitted."""
+    if DEV_MODE:
+        logger.log(level, message, *args)
+
+
+# Chat model used by the coaching agent
+AGENT_MODEL = "openai:gpt-4o-mini"
+
+# Number of workouts uploaded/scheduled concurrently (1 = serial uploads)
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+
+# Seconds to wait for a Garmin login round-trip before giving up
+LOGIN_TIMEOUT = int(os.getenv("LOGIN_TIMEOUT", "30"))
+
+# Chat messages sent verbatim to the agent; older ones are folded into a running summary
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "16"))
+
+# Chat messages kept in memory/on screen; older ones move to a searchable markdown archive
+CHAT_MEMORY_MESSAGES = int(os.getenv("CHAT_MEMORY_MESSAGES", "40"))
+
+# Compiled once at import; populate with SYSTEM_PROMPT.substitute(today=..., user_context=...)
+SYSTEM_PROMPT = Template("""You are an AI Running Coach with access to the user's Garmin data.
+
+TODAY'S DATE: $today
 
 USER'S GARMIN DATA:
-{user_context}
+$user_context
 
 TRAINING PHILOSOPHY - Follow a structured, phased approach:
 
@@ -79,6 +103,8 @@ TOOLS:
 2. read_training_data - Get detailed activity data (splits, HR, cadence)
 3. get_fitness_metrics - Get VO2max, training load, HRV, readiness
 4. create_and_upload_plan - Create and upload workouts to Garmin
+5. load_full_payload - Read the rest of a truncated tool result (use the handle it gives)
+6. search_chat_history - Search older messages from this conversation that are no longer shown
 
 WHEN CREATING WORKOUTS:
 - Use structured workouts with steps (warmup, intervals, cooldown)
@@ -100,4 +126,4 @@ WHEN CREATING FULL TRAINING PLANS:
 - Schedule rest days and recovery weeks
 - Adjust based on user's schedule, injuries, and preferences
 - **Format multi-week plans as a clean markdown table** with columns: Week | Day | Session | Details | KM | Pace
-"""
+""")
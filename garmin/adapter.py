@@ -1,29 +1,106 @@
+import hashlib
 import json
 import logging
 import os
-from garminconnect import Garmin
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from operator import itemgetter
+from garminconnect import (
+    Garmin,
+    GarminConnectAuthenticationError,
+    GarminConnectTooManyRequestsError,
+)
 from garth import Client
-from datetime import datetime, timedelta
-from config import DEV_MODE
+from datetime import date, datetime, timedelta
+from config import dev_log
+from . import cache
 
 logger = logging.getLogger(__name__)
+_log = partial(dev_log, logger)
 
+# Connections kept per host by garth's requests session. fetch_user_data and the calendar
+# fetches run up to ~13 requests at once, above the library default of 10.
+HTTP_POOL_SIZE = 16
+
+# Saved OAuth2 tokens this close to expiry are refreshed at login rather than mid-session
+TOKEN_REFRESH_MARGIN = 5 * 60
+
+# Disk cache lifetimes (seconds): today's numbers and recent activities move during the day,
+# the current/upcoming calendar changes when workouts are scheduled, past months never do
+TODAY_CACHE_TTL = 15 * 60
+CALENDAR_CACHE_TTL = 60 * 60
+PAST_CALENDAR_CACHE_TTL = 30 * 24 * 3600
+
+# Upload/schedule POSTs now run in parallel; pace them process-wide to stay under Garmin's limits
+WRITE_REQUESTS_PER_SECOND = 8
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate seconds apart, across threads."""
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_write_limiter = _RateLimiter(WRITE_REQUESTS_PER_SECOND)
+
+# Workout categories as (type, color, keywords), checked in order - specific before general.
+# Keywords match as plain substrings of the lowercased name + description.
+_CATEGORY_PATTERNS = tuple(
+    (name, color, re.compile("|".join(map(re.escape, keywords))))
+    for name, color, keywords in (
+        ('intervals', '🔴', ['interval', 'speed', 'repeat', 'x800', 'x1000', 'x400', 'fartlek']),
+        ('tempo', '🟡', ['tempo', 'threshold', 'lt', 'lactate']),
+        ('easy', '🟢', ['easy', 'recovery', 'base', 'aerobic']),
+        ('long', '🟢', ['long', 'endurance']),
+        ('rest', '⚪', ['rest', 'off']),
+    )
+)
 
-def _log(level, message):
-    if DEV_MODE:
-        logger.log(level, message)
 
 class MFARequiredError(Exception):
     """Raised when 2FA code is required."""
     pass
 
 class GarminAdapter:
+    # One adapter lives per session (and per restored user); no per-instance __dict__
+    __slots__ = (
+        "email",
+        "password",
+        "client",
+        "_mfa_required",
+        "_garth_tokens",
+        "_full_name",
+        "_unit_system",
+        "tokens_refreshed",
+    )
+
     def __init__(self, email=None, password=None, garth_tokens=None):
         self.email = email or os.environ.get("GARMIN_EMAIL")
         self.password = password or os.environ.get("GARMIN_PASSWORD")
         self.client = None
         self._mfa_required = False
+        if garth_tokens is None and email is None and password is None:
+            # Headless/container runs can ship a garth.dumps() string instead of a token file
+            garth_tokens = os.environ.get("GARMINTOKENS_BASE64")
         self._garth_tokens = garth_tokens  # Pre-loaded tokens for restoration
+        # Per-account values that never change within a session; fetched at most once (see properties)
+        self._full_name = None
+        self._unit_system = None
+        self.tokens_refreshed = False  # Set when login refreshed the saved tokens (worth re-saving)
 
     def login(self, mfa_code=None):
         """
@@ -45,16 +122,22 @@ class GarminAdapter:
         # Try to restore from saved tokens first
         if self._garth_tokens and not mfa_code:
             try:
-                self.client = Garmin(self.email, self.password)
+                self.client = self._new_client()
+                self._full_name = self._unit_system = None
                 # Restore garth session from saved token string
                 self.client.garth.loads(self._garth_tokens)
-                # Test if tokens are still valid
-                self.client.get_full_name()
+                # Check the token locally instead of probing with an API call; an expired (or
+                # nearly expired) OAuth2 token is exchanged via the long-lived OAuth1 token
+                # (no password/2FA)
+                oauth2 = self.client.garth.oauth2_token
+                if oauth2 is None or oauth2.expires_at - time.time() < TOKEN_REFRESH_MARGIN:
+                    self.client.garth.refresh_oauth2()
+                    self.tokens_refreshed = True
                 _log(logging.INFO, "✅ Restored from saved tokens, skipping 2FA")
                 return True
             except Exception as e:
                 # Tokens expired or invalid, fall through to fresh login
-                _log(logging.WARNING, f"❌ Saved tokens invalid: {e}, will request fresh login")
+                _log(logging.WARNING, "❌ Saved tokens invalid: %s, will request fresh login", e)
                 self._garth_tokens = None
         
         # Fresh login flow
@@ -67,10 +150,13 @@ class GarminAdapter:
 
         # Always create fresh client - Garmin handles MFA in the same login flow
         # When mfa_code is provided, it will be returned by prompt_mfa callback
-        self.client = Garmin(self.email, self.password, prompt_mfa=prompt_mfa)
+        self.client = self._new_client(prompt_mfa=prompt_mfa)
+        self._full_name = self._unit_system = None
 
         try:
             self.client.login()
+            # garminconnect loads the profile during login; reuse its name when present
+            self._full_name = getattr(self.client, "full_name", None)
             return True
         except MFARequiredError:
             raise  # Re-raise for the caller to handle
@@ -83,6 +169,61 @@ class GarminAdapter:
                 raise MFARequiredError("2FA code required")
             raise
 
+    @property
+    def full_name(self):
+        """Display name, fetched on first use (or taken from login) and then kept."""
+        if self._full_name is None:
+            if not self.client:
+                self.login()
+            self._full_name = self.client.get_full_name()
+        return self._full_name
+
+    @property
+    def unit_system(self):
+        """Account unit system (metric/statute), fetched on first use and then kept."""
+        if self._unit_system is None:
+            if not self.client:
+                self.login()
+            self._unit_system = self.client.get_unit_system()
+        return self._unit_system
+
+    def _new_client(self, **kwargs):
+        """Garmin client whose HTTP session pools enough connections for our parallel fetches."""
+        client = Garmin(self.email, self.password, **kwargs)
+        # Mounts a pooled HTTPAdapter (with garth's retry policy) on the shared requests session,
+        # so concurrent calls reuse warm TLS connections instead of opening new ones
+        client.garth.configure(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        return client
+
+    def _cache_namespace(self):
+        """Per-account disk cache directory name, or None when the account is unknown."""
+        if self.client is None:
+            return None
+        # The OAuth1 token identifies the account and lasts about a year; email is the fallback
+        oauth1 = getattr(self.client.garth, "oauth1_token", None)
+        ident = getattr(oauth1, "oauth_token", None) or self.email
+        if not ident:
+            return None
+        return hashlib.sha256(ident.encode()).hexdigest()[:16]
+
+    def _cached(self, key, ttl, fn, *args):
+        """Return fn(*args), served from the disk cache when an entry is younger than ttl."""
+        namespace = self._cache_namespace()
+        if namespace is not None:
+            value = cache.get(namespace, key, ttl)
+            if value is not cache.MISS:
+                return value
+        value = fn(*args)
+        if namespace is not None and value is not None:
+            cache.put(namespace, key, value)
+        return value
+
+    def _invalidate_calendar(self):
+        """Forget cached calendar months after the user's schedule changed."""
+        namespace = self._cache_namespace()
+        if namespace is not None:
+            cache.invalidate(namespace, "calendar_")
+
     def get_tokens(self):
         """
         Extract OAuth tokens from the current session for persistence.
@@ -101,55 +242,61 @@ class GarminAdapter:
         if not self.client:
             self.login()
         
-        data = {}
         today = datetime.now().strftime("%Y-%m-%d")
-        
-        _log(logging.INFO, "Fetching user profile...")
-        try:
-            data["full_name"] = self.client.get_full_name()
-            data["unit_system"] = self.client.get_unit_system()
-        except Exception as e:
-            _log(logging.WARNING, f"Warning: Could not fetch profile: {e}")
-
-        _log(logging.INFO, "Fetching stats...")
-        try:
-            data["stats"] = self.client.get_stats(today)
-            data["user_summary"] = self.client.get_user_summary(today)
-        except Exception as e:
-            _log(logging.WARNING, f"Warning: Could not fetch stats: {e}")
-            
-        _log(logging.INFO, "Fetching heart rates...")
-        try:
-            data["heart_rates"] = self.client.get_heart_rates(today)
-        except Exception as e:
-            _log(logging.WARNING, f"Warning: Could not fetch heart rates: {e}")
-            
-        _log(logging.INFO, f"Fetching recent activities ({days_back} days)...")
-        try:
-            data["recent_activities"] = self.fetch_recent_activities(days_back)
-        except Exception as e:
-             _log(logging.WARNING, f"Warning: Could not fetch recent activities: {e}")
-             
-        _log(logging.INFO, "Fetching calendar goals...")
-        try:
-            data["goals"] = self.fetch_goals()
-        except Exception as e:
-            _log(logging.WARNING, f"Warning: Could not fetch goals: {e}")
+        # Independent endpoints - fetch them concurrently, so the total is roughly the slowest
+        # call rather than the sum (garth's requests session is safe for concurrent GETs)
+        calls = {
+            "full_name": (getattr, self, "full_name"),
+            "unit_system": (getattr, self, "unit_system"),
+            "stats": (self._cached, f"stats_{today}", TODAY_CACHE_TTL, self.client.get_stats, today),
+            "user_summary": (
+                self._cached, f"summary_{today}", TODAY_CACHE_TTL, self.client.get_user_summary, today
+            ),
+            "heart_rates": (self._cached, f"hr_{today}", TODAY_CACHE_TTL, self.client.get_heart_rates, today),
+            "recent_activities": (self.fetch_recent_activities, days_back),
+            "goals": (self.fetch_goals,),
+        }
+        _log(logging.INFO, "Fetching user data (%d calls in parallel)...", len(calls))
+        with ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="garmin-fetch") as executor:
+            futures = {key: executor.submit(*call) for key, call in calls.items()}
 
+        data = {}
+        for key, future in futures.items():
+            error = future.exception()
+            if error is None:
+                data[key] = future.result()
+            else:
+                _log(logging.WARNING, "Warning: Could not fetch %s: %s", key, error)
         return data
 
-    def fetch_recent_activities(self, days=14):
-        """Fetch activities from the last N days."""
+    def iter_recent_activities(self, days=14, page_size=20):
+        """
+        Yield activities from the last N days, most recent first.
+        
+        Pages through get_activities and stops at the first activity older than the
+        cutoff, so only the pages actually needed are fetched.
+        """
         if not self.client:
             self.login()
-            
-        # The library uses start/limit, not date range directly for get_activities
-        # We'll fetch a batch and filter, or fetch by count.
-        # Assuming ~1-2 activities per day, limit=days*2 is safe
-        activities = self.client.get_activities(0, days * 2)
         
-        # Filter by date if needed, but get_activities returns most recent first
-        return activities
+        cutoff = datetime.now() - timedelta(days=days)
+        start = 0
+        while True:
+            batch = self._cached(
+                f"activities_{start}_{page_size}", TODAY_CACHE_TTL, self.client.get_activities, start, page_size
+            ) or []
+            for activity in batch:
+                started = activity.get("startTimeLocal")
+                if started and datetime.fromisoformat(started) < cutoff:
+                    return
+                yield activity
+            if len(batch) < page_size:
+                return
+            start += page_size
+
+    def fetch_recent_activities(self, days=14):
+        """Fetch activities from the last N days."""
+        return list(self.iter_recent_activities(days))
 
     def fetch_goals(self):
         """
@@ -171,33 +318,57 @@ class GarminAdapter:
         
         goals = []
         
-        # Fetch current month and next few months
-        for i in range(6):
-            y = year
-            m = month + i
-            if m > 12:
-                m -= 12
-                y += 1
-                
-            try:
-                # Returns calendar data
-                calendar = self.client.get_calendar(y, m)
-                # Parse calendar for race events or goals
-                # Structure is complex, we look for 'calendarItems'
-                for week in calendar.get('calendarWeeks', []):
-                    for day in week.get('calendarDays', []):
-                        for item in day.get('calendarItems', []):
-                            if item.get('itemType') == 'EVENT':
-                                goals.append(item)
-            except Exception as e:
-                pass
+        # Fetch current month and next few months (independent requests, so in parallel)
+        months = [(year + (month - 1 + i) // 12, (month - 1 + i) % 12 + 1) for i in range(6)]
+        for _, item in self._iter_calendar_items(months):
+            if item.get('itemType') == 'EVENT':
+                goals.append(item)
                 
         return goals
 
+    def _safe_get_calendar(self, year, month):
+        """One month of calendar data, or {} if the request fails (auth and rate-limit errors raise)."""
+        now = datetime.now()
+        ttl = PAST_CALENDAR_CACHE_TTL if (year, month) < (now.year, now.month) else CALENDAR_CACHE_TTL
+        try:
+            return self._cached(f"calendar_{year}-{month:02d}", ttl, self.client.get_calendar, year, month)
+        except (GarminConnectAuthenticationError, GarminConnectTooManyRequestsError):
+            # Every other month would fail the same way - fail the whole batch instead
+            raise
+        except Exception as e:
+            _log(logging.WARNING, "Warning: Could not fetch calendar for %s-%s: %s", year, month, e)
+            return {}
+
+    def _get_calendars(self, months):
+        """Fetch several (year, month) calendars concurrently, in the given order."""
+        with ThreadPoolExecutor(max_workers=max(1, len(months)), thread_name_prefix="garmin-calendar") as executor:
+            return list(executor.map(lambda ym: self._safe_get_calendar(*ym), months))
+
+    def _iter_calendar_items(self, months):
+        """
+        Yield (calendarDate, item) for every item in the given months' calendars.
+        
+        Month views include the neighbouring months' days to fill whole weeks, so days
+        already seen in an earlier month are skipped instead of yielding items twice.
+        Calendars come from the shared disk cache, so fetch_goals and
+        fetch_calendar_workouts don't request the same month twice.
+        """
+        seen_days = set()
+        for calendar in self._get_calendars(months):
+            for week in calendar.get('calendarWeeks', []):
+                for day in week.get('calendarDays', []):
+                    day_date_str = day.get('calendarDate')
+                    if day_date_str in seen_days:
+                        continue
+                    seen_days.add(day_date_str)
+                    for item in day.get('calendarItems', []):
+                        yield day_date_str, item
+
     def upload_workout(self, workout_json):
         """Uploads a single workout to Garmin Connect."""
         if not self.client:
             self.login()
+        _write_limiter.wait()
         return self.client.upload_workout(workout_json)
 
     def schedule_workout(self, workout_id, schedule_date):
@@ -224,11 +395,13 @@ class GarminAdapter:
         payload = {"date": date_str}
         
         try:
+            _write_limiter.wait()
             response = self.client.garth.post("connectapi", url, json=payload, api=True)
             result = response.json()
+            self._invalidate_calendar()
             return result
         except Exception as e:
-            _log(logging.WARNING, f"    ⚠️  Could not schedule workout {workout_id}: {e}")
+            _log(logging.WARNING, "    ⚠️  Could not schedule workout %s: %s", workout_id, e)
             return None
 
     def get_existing_workouts(self, limit=200):
@@ -244,6 +417,7 @@ class GarminAdapter:
         
         url = f"/workout-service/workout/{workout_id}"
         self.client.garth.delete("connectapi", url, api=True)
+        self._invalidate_calendar()  # Its scheduled entries disappear with it
 
     def fetch_calendar_workouts(self, days_ahead=14):
         """
@@ -264,76 +438,50 @@ class GarminAdapter:
             _log(logging.WARNING, "⚠️  Calendar API not available in this version of garminconnect")
             return []
         
-        workouts = []
-        today = datetime.now()
+        dated_workouts = []
+        # Plain dates, computed once - every calendar day is compared against them
+        today = date.today()
         end_date = today + timedelta(days=days_ahead)
         
-        # Determine which months to fetch
-        months_to_fetch = set()
-        current = today
-        while current <= end_date:
-            months_to_fetch.add((current.year, current.month))
-            # Move to next month
-            if current.month == 12:
-                current = datetime(current.year + 1, 1, 1)
-            else:
-                current = datetime(current.year, current.month + 1, 1)
+        # Determine which months to fetch: every month from today's through end_date's
+        first = today.year * 12 + today.month - 1
+        last = end_date.year * 12 + end_date.month - 1
+        months_to_fetch = [(m // 12, m % 12 + 1) for m in range(first, last + 1)]
         
-        # Fetch calendar data for each month
-        for year, month in sorted(months_to_fetch):
+        # Fetch calendar data for each month (in parallel; failed months come back empty)
+        for day_date_str, item in self._iter_calendar_items(months_to_fetch):
+            # Check for various workout-related item types
+            if item.get('itemType', '') not in ('WORKOUT', 'SCHEDULED_WORKOUT') or not day_date_str:
+                continue
+            
             try:
-                calendar = self.client.get_calendar(year, month)
-                
-                # Parse calendar structure
-                for week in calendar.get('calendarWeeks', []):
-                    for day in week.get('calendarDays', []):
-                        # Get the date for this day
-                        day_date_str = day.get('calendarDate')
-                        if not day_date_str:
-                            continue
-                        
-                        try:
-                            day_date = datetime.strptime(day_date_str, "%Y-%m-%d")
-                        except:
-                            continue
-                        
-                        # Only include workouts in our date range
-                        if not (today.date() <= day_date.date() <= end_date.date()):
-                            continue
-                        
-                        # Look for workout items
-                        for item in day.get('calendarItems', []):
-                            item_type = item.get('itemType', '')
-                            
-                            # Check for various workout-related item types
-                            if item_type in ['WORKOUT', 'SCHEDULED_WORKOUT']:
-                                workout_name = item.get('workoutName') or item.get('title') or "Workout"
-                                description = item.get('description', '')
-                                
-                                # Classify workout type
-                                workout_type, color = self._classify_workout(workout_name, description)
-                                
-                                workouts.append({
-                                    'date': day_date_str,
-                                    'workout_name': workout_name,
-                                    'workout_type': workout_type,
-                                    'description': description,
-                                    'color': color,
-                                    'date_obj': day_date  # For sorting
-                                })
-            except Exception as e:
-                # Skip this month if there's an error
-                _log(logging.WARNING, f"Warning: Could not fetch calendar for {year}-{month}: {e}")
+                # C-level ISO parser; strptime re-walks the format string per call
+                day_date = date.fromisoformat(day_date_str[:10])
+            except ValueError:
                 continue
+            
+            # Only include workouts in our date range
+            if not (today <= day_date <= end_date):
+                continue
+            
+            workout_name = item.get('workoutName') or item.get('title') or "Workout"
+            description = item.get('description', '')
+            
+            # Classify workout type
+            workout_type, color = self._classify_workout(workout_name, description)
+            
+            # Paired with its date for sorting, so the dicts carry no helper key
+            dated_workouts.append((day_date, {
+                'date': day_date_str,
+                'workout_name': workout_name,
+                'workout_type': workout_type,
+                'description': description,
+                'color': color,
+            }))
         
-        # Sort by date
-        workouts.sort(key=lambda x: x['date_obj'])
-        
-        # Remove the date_obj helper field
-        for w in workouts:
-            del w['date_obj']
-        
-        return workouts
+        # Sort by date (stable, so same-day workouts keep calendar order)
+        dated_workouts.sort(key=itemgetter(0))
+        return [workout for _, workout in dated_workouts]
     
     def _classify_workout(self, name, description):
         """
@@ -341,18 +489,8 @@ class GarminAdapter:
         Returns: (type_name, emoji_color)
         """
         # Combine name and description for keyword search
-        text = (name + " " + description).lower()
-        
-        # Check for workout types (order matters - check specific before general)
-        if any(keyword in text for keyword in ['interval', 'speed', 'repeat', 'x800', 'x1000', 'x400', 'fartlek']):
-            return 'intervals', '🔴'
-        elif any(keyword in text for keyword in ['tempo', 'threshold', 'lt', 'lactate']):
-            return 'tempo', '🟡'
-        elif any(keyword in text for keyword in ['easy', 'recovery', 'base', 'aerobic']):
-            return 'easy', '🟢'
-        elif any(keyword in text for keyword in ['long', 'endurance']):
-            return 'long', '🟢'
-        elif any(keyword in text for keyword in ['rest', 'off']):
-            return 'rest', '⚪'
-        else:
-            return 'other', '⚪'
+        text = f"{name} {description or ''}".lower()
+        for workout_type, color, pattern in _CATEGORY_PATTERNS:
+            if pattern.search(text):
+                return workout_type, color
+        return 'other', '⚪'
@@ -4,24 +4,36 @@ Handles login with token persistence and 2FA.
 """
 
 import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial
 import streamlit as st
 from .adapter import GarminAdapter, MFARequiredError
-from config import DEV_MODE
+from config import LOGIN_TIMEOUT, dev_log
 from user_storage import (
     save_garmin_token, load_garmin_token,
     load_conversation, get_user_id
 )
 
 logger = logging.getLogger(__name__)
+_log = partial(dev_log, logger)
 
+# Login calls run here so a hung Garmin request cannot block the script thread indefinitely
+_login_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="garmin-login")
+
+
+def _run_with_timeout(fn, *args, **kwargs):
+    """Run a blocking Garmin call on the login pool, raising TimeoutError after LOGIN_TIMEOUT seconds."""
+    future = _login_pool.submit(fn, *args, **kwargs)
+    try:
+        return future.result(timeout=LOGIN_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Garmin login timed out after {LOGIN_TIMEOUT}s")
 
-def _log(level, message):
-    if DEV_MODE:
-        logger.log(level, message)
 
 def _handle_successful_login(adapter, email, password):
     """Handle successful login: save tokens and username, load conversation."""
-    name = adapter.client.get_full_name()
+    name = _run_with_timeout(getattr, adapter, "full_name")  # No request if login already knew it
     user_id = get_user_id(email, password)
     
     # Save tokens and username for next time
@@ -67,21 +79,21 @@ def attempt_garmin_login(email, password, mfa_code=None):
             if saved_tokens:
                 _log(logging.INFO, "Found saved token for user, attempting restore...")
                 adapter = GarminAdapter(email=email, password=password, garth_tokens=saved_tokens)
-                adapter.login()
+                _run_with_timeout(adapter.login)
                 _log(logging.INFO, "Token restore successful!")
                 return _handle_successful_login(adapter, email, password)
         
         # 2. MFA continuation (reuse pending adapter from step 1)
         if mfa_code and "pending_adapter" in st.session_state:
             adapter = st.session_state.pending_adapter
-            adapter.login(mfa_code=mfa_code)
+            _run_with_timeout(adapter.login, mfa_code=mfa_code)
             del st.session_state.pending_adapter
             return _handle_successful_login(adapter, email, password)
         
         # 3. Fresh login (no saved tokens)
         _log(logging.INFO, "No saved token found, starting fresh login...")
         adapter = GarminAdapter(email=email, password=password)
-        adapter.login(mfa_code=mfa_code)
+        _run_with_timeout(adapter.login, mfa_code=mfa_code)
         return _handle_successful_login(adapter, email, password)
         
     except MFARequiredError:
@@ -92,5 +104,5 @@ def attempt_garmin_login(email, password, mfa_code=None):
         return False, "2FA code required", True
     
     except Exception as e:
-        _log(logging.ERROR, f"Login failed: {e}")
+        _log(logging.ERROR, "Login failed: %s", e)
         return False, str(e), False
@@ -0,0 +1,109 @@
+"""
+File-backed TTL cache for Garmin API responses.
+
+One JSON file per (namespace, key) under user_data/garmin_cache/<namespace>/; the file's
+mtime is the entry's age, so no index needs to be kept in sync. Namespaces separate
+Garmin accounts. Many keys embed a date and are never read again once it passes, so
+put() periodically sweeps out files older than MAX_AGE_SECONDS.
+"""
+
+import json
+import logging
+import os
+import time
+from functools import partial
+
+from config import dev_log
+
+try:
+    import orjson
+except ImportError:  # Optional speedup - fall back to the stdlib json module
+    orjson = None
+
+logger = logging.getLogger(__name__)
+_log = partial(dev_log, logger)
+
+CACHE_DIR = os.path.join("user_data", "garmin_cache")
+
+# Returned by get() on a miss, since None is a valid cached response
+MISS = object()
+
+# No caller uses a longer TTL than this (past calendar months), so older files are dead
+MAX_AGE_SECONDS = 30 * 24 * 3600
+# A namespace directory is swept at most this often per process
+SWEEP_INTERVAL_SECONDS = 3600
+_last_sweep = {}
+
+
+def _path(namespace, key):
+    return os.path.join(CACHE_DIR, namespace, f"{key}.json")
+
+
+def get(namespace, key, ttl):
+    """Cached value for key if it is younger than ttl seconds, else MISS."""
+    path = _path(namespace, key)
+    try:
+        if time.time() - os.path.getmtime(path) >= ttl:
+            _remove(path)
+            return MISS
+        with open(path, "rb") as f:
+            raw = f.read()
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except FileNotFoundError:
+        return MISS
+    except (OSError, ValueError) as e:
+        _log(logging.WARNING, "Unreadable cache entry %s: %s", path, e)
+        return MISS
+
+
+def put(namespace, key, value):
+    """Store a JSON-serializable value (failures are logged, never raised)."""
+    path = _path(namespace, key)
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(value) if orjson is not None else json.dumps(value).encode())
+        os.replace(tmp_path, path)
+    except (OSError, TypeError) as e:
+        _log(logging.WARNING, "Could not cache %s: %s", path, e)
+        return
+    now = time.monotonic()
+    if now - _last_sweep.get(namespace, float("-inf")) >= SWEEP_INTERVAL_SECONDS:
+        _last_sweep[namespace] = now
+        _sweep(namespace)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _sweep(namespace):
+    """Delete entries (and stray temp files) older than MAX_AGE_SECONDS."""
+    directory = os.path.join(CACHE_DIR, namespace)
+    cutoff = time.time() - MAX_AGE_SECONDS
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        _remove(entry.path)
+                except OSError:
+                    continue
+    except OSError as e:
+        _log(logging.WARNING, "Could not sweep cache %s: %s", directory, e)
+
+
+def invalidate(namespace, prefix=""):
+    """Drop every entry in the namespace whose key starts with prefix."""
+    directory = os.path.join(CACHE_DIR, namespace)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.startswith(prefix):
+            _remove(os.path.join(directory, name))
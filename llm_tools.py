@@ -1,22 +1,63 @@
+import contextvars
+import hashlib
 import json
 import logging
+import threading
+import time
 import traceback
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
 from langchain.tools import tool
-from garmin.adapter import GarminAdapter
 from workout_manager import WorkoutManager
-from config import DEV_MODE
+from config import DEV_MODE, UPLOAD_WORKERS, dev_log
+from user_storage import search_archived_messages
+
+try:
+    import orjson
+except ImportError:  # Optional speedup - fall back to the stdlib json module
+    orjson = None
+
+# Resolved once at import instead of on every tool call
+try:
+    import streamlit as st
+except ImportError:
+    st = None  # Streamlit not available (e.g., in tests)
 
 # Global adapter - set by app.py after successful login
 # Also stores per-session data (full_activities, last_plan) to avoid shared files
 _shared_adapter = None
 _session_data = {}
 logger = logging.getLogger(__name__)
+_log = partial(dev_log, logger)
+
+_BANNER = "=" * 70
+
+# The (adapter, user_id) a tool call belongs to. Agent tools run on event-loop and
+# executor threads, where st.session_state isn't visible, but context variables are
+# copied into them - so each chat turn binds its own session here (see use_tool_session)
+_tool_session = contextvars.ContextVar("tool_session", default=None)
 
+# How long fetch_user_context / get_fitness_metrics results are reused for identical calls;
+# Garmin fitness data updates at most hourly. Keys start with the user_id, never an
+# object id, so entries can't be served to another user
+TOOL_RESULT_TTL_SECONDS = 900
+TOOL_RESULT_CACHE_SIZE = 256
+_tool_results = OrderedDict()
+_tool_results_lock = threading.Lock()
 
-def _log(level, message):
-    if DEV_MODE:
-        logger.log(level, message)
+# Independent Garmin calls within one tool or sidebar refresh run here concurrently
+_garmin_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="garmin-tool")
+
+# Tool results longer than this are truncated; the full text stays available via load_full_payload
+TOOL_OUTPUT_LIMIT = 8000
+
+# Full text of truncated results, keyed by (user_id, handle) so a handle only resolves
+# for the user it was issued to; least recently read payloads are dropped first
+PAYLOAD_CACHE_SIZE = 64
+_payloads = OrderedDict()
+_payloads_lock = threading.Lock()
 
 
 def set_adapter(adapter):
@@ -27,23 +68,73 @@ def set_adapter(adapter):
     _session_data = {"full_activities": [], "last_plan": []}
     
     # Also store in Streamlit session state if available
-    try:
-        import streamlit as st
-        if hasattr(st, 'session_state'):
+    if st is not None:
+        try:
             st.session_state.garmin_adapter = adapter
-    except:
-        pass  # Streamlit not available (e.g., in tests)
+        except Exception:
+            pass  # No Streamlit session (e.g., in tests)
+
+
+def use_tool_session(adapter, user_id):
+    """Bind the adapter and user that tools run from the current context should use."""
+    _tool_session.set((adapter, user_id))
+
+
+def clear_cached_context(user_id):
+    """Forget a user's cached tool results so the next call hits Garmin again."""
+    with _tool_results_lock:
+        for key in [k for k in _tool_results if k[1] == user_id]:
+            del _tool_results[key]
+
+
+def _cached_tool_result(key):
+    """A tool's result text for key if computed within TOOL_RESULT_TTL_SECONDS, else None."""
+    with _tool_results_lock:
+        entry = _tool_results.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= TOOL_RESULT_TTL_SECONDS:
+            del _tool_results[key]
+            return None
+        _tool_results.move_to_end(key)
+        return entry[1]
+
+
+def _store_tool_result(key, text):
+    with _tool_results_lock:
+        _tool_results[key] = (time.monotonic(), text)
+        _tool_results.move_to_end(key)
+        while len(_tool_results) > TOOL_RESULT_CACHE_SIZE:
+            _tool_results.popitem(last=False)
+
+
+def _current_user_id():
+    """user_id of the session a tool is running for, or None if unknown."""
+    session = _tool_session.get()
+    if session is not None:
+        return session[1]
+    if st is not None:
+        try:
+            return st.session_state.get("user_id")
+        except Exception:
+            pass  # No Streamlit session (e.g., in tests)
+    return None
 
 
 def _get_adapter():
     """Get the shared authenticated Garmin adapter."""
-    # First try to get from Streamlit session state
-    try:
-        import streamlit as st
-        if hasattr(st, 'session_state') and 'garmin_adapter' in st.session_state:
-            return st.session_state.garmin_adapter
-    except:
-        pass  # Streamlit not available (e.g., in tests)
+    # The session bound for this agent turn, if any
+    session = _tool_session.get()
+    if session is not None and session[0] is not None:
+        return session[0]
+    
+    # Then try to get from Streamlit session state
+    if st is not None:
+        try:
+            if 'garmin_adapter' in st.session_state:
+                return st.session_state.garmin_adapter
+        except Exception:
+            pass  # No Streamlit session (e.g., tool running on a worker thread)
     
     # Fallback to global variable
     global _shared_adapter
@@ -52,10 +143,35 @@ def _get_adapter():
     return _shared_adapter
 
 
+def _loads(text):
+    """Parse JSON text, using orjson when available (raises json.JSONDecodeError either way)."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _dumps(data):
+    """Serialize tool output as indented JSON text, using orjson's native encoder when available."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
+class _JSONArg:
+    """Log argument that is serialized only if the record is actually emitted."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return _dumps(self.data)
+
+
 def _seconds_to_pace(seconds_per_km):
     """Convert seconds/km to pace string."""
-    mins = int(seconds_per_km // 60)
-    secs = int(seconds_per_km % 60)
+    mins, secs = divmod(int(seconds_per_km), 60)
     return f"{mins}:{secs:02d}/km"
 
 
@@ -67,32 +183,54 @@ def _speed_to_pace(speed_ms):
     return _seconds_to_pace(seconds_per_km)
 
 
-@tool
-def fetch_user_context(goal: str = "", notes: str = "") -> str:
+def _truncate_payload(text):
+    """Cap a tool result for the model, keeping the full text under a short handle."""
+    if len(text) <= TOOL_OUTPUT_LIMIT:
+        return text
+    handle = hashlib.md5(text.encode()).hexdigest()[:8]
+    key = (_current_user_id(), handle)
+    with _payloads_lock:
+        _payloads[key] = text
+        _payloads.move_to_end(key)
+        while len(_payloads) > PAYLOAD_CACHE_SIZE:
+            _payloads.popitem(last=False)
+    return (
+        f"{text[:TOOL_OUTPUT_LIMIT]}\n...[truncated, {len(text)} chars total; "
+        f"call load_full_payload(handle=\"{handle}\", offset={TOOL_OUTPUT_LIMIT}) for the rest]"
+    )
+
+
+def build_user_context(adapter, user_id, goal="", notes=""):
     """
-    Fetches the user's Garmin data including recent runs, race predictions, goals, and training zones.
-    
-    ALWAYS call this FIRST before creating any workout plan!
-    
-    Args:
-        goal: The user's training goal if mentioned (e.g., "sub-3:30 marathon")
-        notes: Any specific notes from the user
-    
-    Returns:
-        JSON with user's profile, upcoming race goals, recent runs with paces, race predictions, and suggested training zones.
+    The fetch_user_context result for a given adapter and user.
+
+    Takes both explicitly so callers off the script thread (the post-login prefetch)
+    never fall back to the process-wide adapter of another session.
     """
+    global _session_data
     try:
-        adapter = _get_adapter()
+        # Reuse a recent identical call (e.g. the startup fetch) instead of re-fetching
+        context_key = ("context", user_id, date.today().isoformat(), goal, notes)
+        cached = _cached_tool_result(context_key) if user_id is not None else None
+        if cached is not None:
+            return cached
+        
+        # Fire the independent requests together; results are collected below in order
+        name_future = _garmin_pool.submit(getattr, adapter, "full_name")
+        plans_future = _garmin_pool.submit(adapter.client.get_training_plans)
+        predictions_future = _garmin_pool.submit(adapter.client.get_race_predictions)
+        lt_future = _garmin_pool.submit(adapter.client.get_lactate_threshold, latest=True)
+        activities_future = _garmin_pool.submit(adapter.client.get_activities, 0, 15)
         
         summary = {
-            "name": adapter.client.get_full_name(),
+            "name": name_future.result(),
             "user_stated_goal": goal or "Not specified",
             "notes": notes or "None",
         }
         
         # Get training plans (contains race events with dates!)
         try:
-            plans_data = adapter.client.get_training_plans()
+            plans_data = plans_future.result()
             plans = plans_data.get("trainingPlanList", [])
             if plans:
                 upcoming_races = []
@@ -113,7 +251,7 @@ def fetch_user_context(goal: str = "", notes: str = "") -> str:
         
         # Get race predictions
         try:
-            predictions = adapter.client.get_race_predictions()
+            predictions = predictions_future.result()
             if predictions:
                 summary["race_predictions"] = {
                     "5K": _seconds_to_pace(predictions.get("time5K", 0) / 5),
@@ -127,7 +265,7 @@ def fetch_user_context(goal: str = "", notes: str = "") -> str:
         
         # Get lactate threshold
         try:
-            lt = adapter.client.get_lactate_threshold(latest=True)
+            lt = lt_future.result()
             if lt:
                 summary["lactate_threshold"] = {
                     "heart_rate": lt.get("speed_and_heart_rate", {}).get("heartRate"),
@@ -137,7 +275,7 @@ def fetch_user_context(goal: str = "", notes: str = "") -> str:
             summary["lactate_threshold"] = f"Error: {e}"
         
         # Get recent activities with proper speed data
-        activities = adapter.client.get_activities(0, 15)
+        activities = activities_future.result()
         recent_runs = []
         full_activities = []  # Store full data for file
         
@@ -147,37 +285,42 @@ def fetch_user_context(goal: str = "", notes: str = "") -> str:
                 max_speed = act.get("maxSpeed", 0)
                 distance = act.get("distance", 0)
                 duration = act.get("duration", 0)
+                run_date = act.get("startTimeLocal", "")[:10]
+                run_name = act.get("activityName", "Run")
+                avg_hr = act.get("averageHR")
+                max_hr = act.get("maxHR")
+                aerobic_effect = act.get("aerobicTrainingEffect")
                 
                 # Summary for context
                 run_data = {
-                    "date": act.get("startTimeLocal", "")[:10],
-                    "name": act.get("activityName", "Run"),
+                    "date": run_date,
+                    "name": run_name,
                     "distance_km": round(distance / 1000, 1),
                     "duration_min": round(duration / 60, 0),
                     "avg_pace": _speed_to_pace(avg_speed),
                     "avg_speed_ms": round(avg_speed, 2) if avg_speed else None,
                     "max_pace": _speed_to_pace(max_speed),
-                    "avg_hr": act.get("averageHR"),
-                    "max_hr": act.get("maxHR"),
-                    "training_effect": act.get("aerobicTrainingEffect"),
+                    "avg_hr": avg_hr,
+                    "max_hr": max_hr,
+                    "training_effect": aerobic_effect,
                 }
                 recent_runs.append(run_data)
                 
                 # Full data for file
                 full_activities.append({
                     "activity_id": act.get("activityId"),
-                    "date": act.get("startTimeLocal", "")[:10],
-                    "name": act.get("activityName", "Run"),
+                    "date": run_date,
+                    "name": run_name,
                     "distance_m": distance,
                     "duration_sec": duration,
                     "avg_speed_ms": avg_speed,
                     "max_speed_ms": max_speed,
-                    "avg_hr": act.get("averageHR"),
-                    "max_hr": act.get("maxHR"),
+                    "avg_hr": avg_hr,
+                    "max_hr": max_hr,
                     "calories": act.get("calories"),
                     "elevation_gain": act.get("elevationGain"),
                     "avg_cadence": act.get("averageRunningCadenceInStepsPerMinute"),
-                    "training_effect_aerobic": act.get("aerobicTrainingEffect"),
+                    "training_effect_aerobic": aerobic_effect,
                     "training_effect_anaerobic": act.get("anaerobicTrainingEffect"),
                     "avg_power": act.get("avgPower"),
                     "description": act.get("description", ""),
@@ -204,18 +347,41 @@ def fetch_user_context(goal: str = "", notes: str = "") -> str:
                 }
         
         # Store full training data in session (not file - for multi-user safety)
-        global _session_data
         _session_data["full_activities"] = full_activities
         _session_data["fetched_at"] = datetime.now().isoformat()
         
         summary["note"] = "Full activity details available - use read_training_data tool for more detail"
         
-        return json.dumps(summary, indent=2, ensure_ascii=False)
+        context_text = _dumps(summary)
+        if user_id is not None:
+            _store_tool_result(context_key, context_text)
+        return context_text
         
     except Exception as e:
         return f"Error fetching Garmin data: {str(e)}"
 
 
+@tool
+def fetch_user_context(goal: str = "", notes: str = "") -> str:
+    """
+    Fetches the user's Garmin data including recent runs, race predictions, goals, and training zones.
+    
+    ALWAYS call this FIRST before creating any workout plan!
+    
+    Args:
+        goal: The user's training goal if mentioned (e.g., "sub-3:30 marathon")
+        notes: Any specific notes from the user
+    
+    Returns:
+        JSON with user's profile, upcoming race goals, recent runs with paces, race predictions, and suggested training zones.
+    """
+    try:
+        adapter = _get_adapter()
+    except Exception as e:
+        return f"Error fetching Garmin data: {str(e)}"
+    return build_user_context(adapter, _current_user_id(), goal, notes)
+
+
 @tool
 def read_training_data() -> str:
     """
@@ -241,11 +407,62 @@ def read_training_data() -> str:
             "full_activities": _session_data["full_activities"]
         }
         
-        return json.dumps(data, indent=2, ensure_ascii=False)
+        return _truncate_payload(_dumps(data))
     except Exception as e:
         return f"Error reading training data: {str(e)}"
 
 
+def _upload_and_schedule(adapter, manager, workout, index, total):
+    """
+    Convert, upload and schedule a single workout.
+    
+    Runs on a worker thread so several workouts' HTTP round-trips overlap.
+    Returns (result_line, uploaded).
+    """
+    workout_name = workout.get('workoutName', 'Unknown')
+    schedule_date_str = workout.get('scheduleDate', 'No date')
+    
+    _log(logging.INFO, "📋 Workout %s/%s: %s", index, total, workout_name)
+    _log(logging.INFO, "   Schedule date: %s", schedule_date_str)
+    _log(logging.INFO, "   Input workout JSON: %s", _JSONArg(workout))
+    
+    try:
+        # Convert and upload
+        _log(logging.INFO, "   ⚙️  Converting to Garmin format...")
+        garmin_json = manager.convert_to_garmin_format(workout)
+        _log(logging.INFO, "   ✓ Converted successfully")
+        _log(logging.INFO, "   Garmin JSON: %s", _JSONArg(garmin_json))
+        
+        _log(logging.INFO, "   📤 Uploading to Garmin...")
+        result = adapter.upload_workout(garmin_json)
+        _log(logging.INFO, "   ✓ Upload response: %s", _JSONArg(result))
+        workout_id = result.get('workoutId')
+        
+        if not workout_id:
+            _log(logging.WARNING, "   ❌ NO WORKOUT ID in response")
+            return f"⚠ {workout_name} - no workout ID returned", False
+        
+        _log(logging.INFO, "   Workout ID: %s", workout_id)
+        _log(logging.INFO, "   📅 Scheduling workout %s for %s...", workout_id, schedule_date_str)
+        schedule_result = adapter.schedule_workout(workout_id, schedule_date_str)
+        _log(logging.INFO, "   Schedule response: %s", _JSONArg(schedule_result))
+        
+        if schedule_result:
+            schedule_id = schedule_result.get('workoutScheduleId')
+            _log(logging.INFO, "   ✅ SCHEDULED! Schedule ID: %s", schedule_id)
+            return f"✓ {workout_name} scheduled for {schedule_date_str}", True
+        
+        _log(logging.WARNING, "   ❌ SCHEDULING FAILED")
+        # Still count as success since workout was uploaded
+        return f"⚠ {workout_name} - scheduled failed but workout uploaded", True
+    
+    except Exception as e:
+        _log(logging.ERROR, "   ❌ ERROR: %s", e)
+        if DEV_MODE:
+            _log(logging.INFO, "   Full traceback:\n%s", traceback.format_exc())
+        return f"✗ {workout_name}: {str(e)}", False
+
+
 @tool  
 def create_and_upload_plan(plan_json: str, confirmed: bool = False) -> str:
     """
@@ -299,8 +516,13 @@ def create_and_upload_plan(plan_json: str, confirmed: bool = False) -> str:
     Returns:
         Preview of plan or upload results
     """
+    # Reject empty plans before paying for a JSON parse
+    stripped = plan_json.strip() if isinstance(plan_json, str) else plan_json
+    if not stripped or stripped == "[]":
+        return "Error: Plan is empty"
+    
     try:
-        plan_data = json.loads(plan_json)
+        plan_data = _loads(plan_json)
         if not isinstance(plan_data, list):
             return "Error: Plan must be a JSON array of workouts"
         
@@ -313,82 +535,41 @@ def create_and_upload_plan(plan_json: str, confirmed: bool = False) -> str:
         
         # If not confirmed, show preview
         if not confirmed:
-            summary = f"**Plan with {len(plan_data)} workouts:**\n\n"
+            lines = [f"**Plan with {len(plan_data)} workouts:**", ""]
             for w in plan_data:
-                date = w.get("scheduleDate", "TBD")
+                schedule_date = w.get("scheduleDate", "TBD")
                 name = w.get("workoutName", "Workout")
                 desc = w.get("description", "")
-                summary += f"• {date}: **{name}** - {desc}\n"
-            summary += "\n*Reply 'yes' to upload these workouts to Garmin.*"
-            return summary
+                lines.append(f"• {schedule_date}: **{name}** - {desc}")
+            lines.append("")
+            lines.append("*Reply 'yes' to upload these workouts to Garmin.*")
+            return "\n".join(lines)
         
         # Upload to Garmin
         adapter = _get_adapter()
         manager = WorkoutManager()
         
-        results = []
-        success_count = 0
+        _log(logging.INFO, "%s\n🔧 UPLOADING %d WORKOUTS\n%s", _BANNER, len(plan_data), _BANNER)
         
-        _log(logging.INFO, "======================================================================")
-        _log(logging.INFO, f"🔧 UPLOADING {len(plan_data)} WORKOUTS")
-        _log(logging.INFO, "======================================================================")
+        with ThreadPoolExecutor(max_workers=max(1, UPLOAD_WORKERS)) as executor:
+            futures = [
+                executor.submit(_upload_and_schedule, adapter, manager, workout, i, len(plan_data))
+                for i, workout in enumerate(plan_data, 1)
+            ]
+            outcomes = [future.result() for future in futures]
         
-        for i, workout in enumerate(plan_data, 1):
-            workout_name = workout.get('workoutName', 'Unknown')
-            schedule_date_str = workout.get('scheduleDate', 'No date')
-            
-            _log(logging.INFO, f"📋 Workout {i}/{len(plan_data)}: {workout_name}")
-            _log(logging.INFO, f"   Schedule date: {schedule_date_str}")
-            _log(logging.INFO, f"   Input workout JSON: {json.dumps(workout, indent=2)}")
-            
-            try:
-                # Convert and upload
-                _log(logging.INFO, "   ⚙️  Converting to Garmin format...")
-                garmin_json = manager.convert_to_garmin_format(workout)
-                _log(logging.INFO, "   ✓ Converted successfully")
-                _log(logging.INFO, f"   Garmin JSON: {json.dumps(garmin_json, indent=2)}")
-                
-                _log(logging.INFO, "   📤 Uploading to Garmin...")
-                result = adapter.upload_workout(garmin_json)
-                _log(logging.INFO, f"   ✓ Upload response: {json.dumps(result, indent=2)}")
-                workout_id = result.get('workoutId')
-                
-                if workout_id:
-                    _log(logging.INFO, f"   Workout ID: {workout_id}")
-                    _log(logging.INFO, f"   📅 Scheduling workout {workout_id} for {schedule_date_str}...")
-                    schedule_result = adapter.schedule_workout(workout_id, schedule_date_str)
-                    _log(logging.INFO, f"   Schedule response: {json.dumps(schedule_result, indent=2) if schedule_result else 'None'}")
-                    
-                    if schedule_result:
-                        schedule_id = schedule_result.get('workoutScheduleId')
-                        _log(logging.INFO, f"   ✅ SCHEDULED! Schedule ID: {schedule_id}")
-                        results.append(f"✓ {workout_name} scheduled for {schedule_date_str}")
-                        success_count += 1
-                    else:
-                        _log(logging.WARNING, "   ❌ SCHEDULING FAILED")
-                        results.append(f"⚠ {workout_name} - scheduled failed but workout uploaded")
-                        success_count += 1  # Still count as success since workout was uploaded
-                else:
-                    _log(logging.WARNING, "   ❌ NO WORKOUT ID in response")
-                    results.append(f"⚠ {workout_name} - no workout ID returned")
-                    
-            except Exception as e:
-                error_trace = traceback.format_exc()
-                _log(logging.ERROR, f"   ❌ ERROR: {e}")
-                _log(logging.INFO, f"   Full traceback:\n{error_trace}")
-                results.append(f"✗ {workout_name}: {str(e)}")
+        results = [line for line, _ in outcomes]
+        success_count = sum(1 for _, uploaded in outcomes if uploaded)
         
-        _log(logging.INFO, "======================================================================")
-        _log(logging.INFO, f"✅ Upload complete: {success_count}/{len(plan_data)} successful")
-        _log(logging.INFO, "======================================================================")
+        _log(logging.INFO, "%s\n✅ Upload complete: %d/%d successful\n%s", _BANNER, success_count, len(plan_data), _BANNER)
         
         return f"**Uploaded {success_count}/{len(plan_data)} workouts:**\n" + "\n".join(results)
         
     except json.JSONDecodeError as e:
-        _log(logging.ERROR, f"❌ JSON decode error: {e}")
+        _log(logging.ERROR, "❌ JSON decode error: %s", e)
         return f"Error: Invalid JSON - {e}"
     except Exception as e:
-        _log(logging.ERROR, f"❌ Unexpected error: {e}")
+        _log(logging.ERROR, "❌ Unexpected error: %s", e)
         return f"Error: {str(e)}"
 
 
@@ -412,13 +593,23 @@ def get_fitness_metrics() -> str:
     """
     try:
         adapter = _get_adapter()
+        user_id = _current_user_id()
         today = datetime.now().strftime("%Y-%m-%d")
+        metrics_key = ("metrics", user_id, today)
+        cached = _cached_tool_result(metrics_key) if user_id is not None else None
+        if cached is not None:
+            return cached
+        
+        # Independent requests - run them together, then read each result in turn
+        status_future = _garmin_pool.submit(adapter.client.get_training_status, today)
+        readiness_future = _garmin_pool.submit(adapter.client.get_training_readiness, today)
+        hrv_future = _garmin_pool.submit(adapter.client.get_hrv_data, today)
         
         result = {}
         
         # Training status
         try:
-            status = adapter.client.get_training_status(today)
+            status = status_future.result()
             if status:
                 result["training_status"] = {
                     "status": status.get("trainingStatusPhrase"),
@@ -432,7 +623,7 @@ def get_fitness_metrics() -> str:
         
         # Training readiness
         try:
-            readiness = adapter.client.get_training_readiness(today)
+            readiness = readiness_future.result()
             if readiness:
                 result["readiness"] = {
                     "score": readiness.get("score"),
@@ -444,7 +635,7 @@ def get_fitness_metrics() -> str:
         
         # HRV data
         try:
-            hrv = adapter.client.get_hrv_data(today)
+            hrv = hrv_future.result()
             if hrv:
                 result["hrv"] = {
                     "weekly_average": hrv.get("hrvSummary", {}).get("weeklyAvg"),
@@ -454,12 +645,58 @@ def get_fitness_metrics() -> str:
         except Exception as e:
             result["hrv_error"] = str(e)
         
-        return json.dumps(result, indent=2, ensure_ascii=False)
+        metrics_text = _truncate_payload(_dumps(result))
+        if user_id is not None:
+            _store_tool_result(metrics_key, metrics_text)
+        return metrics_text
         
     except Exception as e:
         return f"Error getting fitness metrics: {str(e)}"
 
 
+@tool
+def load_full_payload(handle: str, offset: int = 0) -> str:
+    """
+    Read more of a truncated tool result.
+    
+    Use when read_training_data or get_fitness_metrics output ends with a
+    "[truncated ...]" marker. Pass the handle and offset from that marker;
+    returns the next chunk of the original text.
+    """
+    key = (_current_user_id(), handle)
+    with _payloads_lock:
+        payload = _payloads.get(key)
+        if payload is not None:
+            _payloads.move_to_end(key)
+    if payload is None:
+        return f"Error: No stored payload for handle '{handle}'. Call the original tool again."
+    chunk = payload[offset:offset + TOOL_OUTPUT_LIMIT]
+    end = offset + len(chunk)
+    if end < len(payload):
+        chunk += f"\n...[more: load_full_payload(handle=\"{handle}\", offset={end})]"
+    return chunk
+
+
+@tool
+def search_chat_history(query: str) -> str:
+    """
+    Search earlier messages of this conversation that are no longer in the chat.
+    
+    Use when the user refers to something discussed a while ago (an injury,
+    a past plan, a preference) that you cannot see in the recent messages.
+    
+    Args:
+        query: A few keywords, e.g. "knee injury" or "marathon plan"
+    """
+    user_id = _current_user_id()
+    if not user_id:
+        return "No archived conversation available."
+    matches = search_archived_messages(user_id, query)
+    if not matches:
+        return f"No earlier messages mention '{query}'."
+    return _truncate_payload("\n\n---\n\n".join(matches))
+
+
 def get_sidebar_stats():
     """
     Get quick stats for sidebar display (no tool decorator - called directly from UI).
@@ -479,6 +716,13 @@ def get_sidebar_stats():
         
         stats = {}
         today = datetime.now()
+        today_str = today.strftime("%Y-%m-%d")
+        
+        # The four requests below are independent - start them all before reading any
+        plans_future = _garmin_pool.submit(adapter.client.get_training_plans)
+        activities_future = _garmin_pool.submit(adapter.client.get_activities, 0, 30)  # Last 30 activities
+        status_future = _garmin_pool.submit(adapter.client.get_training_status, today_str)
+        readiness_future = _garmin_pool.submit(adapter.client.get_training_readiness, today_str)
         
         # 1. Days until race (from fetch_user_context data if available)
         stats['days_until_race'] = None
@@ -486,7 +730,7 @@ def get_sidebar_stats():
         
         try:
             # Check if we have user context with race info
-            plans_data = adapter.client.get_training_plans()
+            plans_data = plans_future.result()
             plans = plans_data.get("trainingPlanList", [])
             if plans:
                 # Find the earliest upcoming race
@@ -495,7 +739,7 @@ def get_sidebar_stats():
                     race_date_str = p.get("endDate", "")[:10] if p.get("endDate") else None
                     if race_date_str:
                         try:
-                            race_date = datetime.strptime(race_date_str, "%Y-%m-%d")
+                            race_date = datetime.fromisoformat(race_date_str)
                             if race_date >= today:
                                 upcoming_races.append({
                                     "name": p.get("name", "Race"),
@@ -512,7 +756,7 @@ def get_sidebar_stats():
                     stats['race_name'] = nearest['name']
         except Exception as e:
             # Race data unavailable, leave as None
-            _log(logging.ERROR, f"❌ Could not fetch race data: {e}")
+            _log(logging.ERROR, "❌ Could not fetch race data: %s", e)
             if DEV_MODE:
                 traceback.print_exc()
         
@@ -521,7 +765,7 @@ def get_sidebar_stats():
         stats['last_week_km'] = None
         
         try:
-            activities = adapter.client.get_activities(0, 30)  # Get last 30 activities
+            activities = activities_future.result()
             
             # Calculate rolling 7-day windows
             today_date = today.date()
@@ -530,9 +774,9 @@ def get_sidebar_stats():
             previous_7_days_end = today_date - timedelta(days=7)
             
             _log(logging.INFO, "🔍 Date ranges:")
-            _log(logging.INFO, f"   Today: {today_date}")
-            _log(logging.INFO, f"   Last 7 days: {last_7_days_start} to {today_date}")
-            _log(logging.INFO, f"   Previous 7 days: {previous_7_days_start} to {previous_7_days_end}")
+            _log(logging.INFO, "   Today: %s", today_date)
+            _log(logging.INFO, "   Last 7 days: %s to %s", last_7_days_start, today_date)
+            _log(logging.INFO, "   Previous 7 days: %s to %s", previous_7_days_start, previous_7_days_end)
             
             last_7_distance = 0
             previous_7_distance = 0
@@ -544,27 +788,27 @@ def get_sidebar_stats():
                     act_date_str = act.get("startTimeLocal", "")[:10]
                     if act_date_str:
                         try:
-                            act_date = datetime.strptime(act_date_str, "%Y-%m-%d").date()
+                            act_date = date.fromisoformat(act_date_str)
                             distance_m = act.get("distance", 0)
                             
                             if last_7_days_start <= act_date <= today_date:
                                 last_7_distance += distance_m
-                                _log(logging.INFO, f"   ✓ {act_date}: {distance_m/1000:.1f}km (last 7 days)")
+                                _log(logging.INFO, "   ✓ %s: %.1fkm (last 7 days)", act_date, distance_m / 1000)
                             elif previous_7_days_start <= act_date <= previous_7_days_end:
                                 previous_7_distance += distance_m
-                                _log(logging.INFO, f"   ✓ {act_date}: {distance_m/1000:.1f}km (previous 7 days)")
+                                _log(logging.INFO, "   ✓ %s: %.1fkm (previous 7 days)", act_date, distance_m / 1000)
                         except Exception as e:
-                            _log(logging.WARNING, f"Error parsing activity date {act_date_str}: {e}")
+                            _log(logging.WARNING, "Error parsing activity date %s: %s", act_date_str, e)
             
-            _log(logging.INFO, f"📊 Found {running_count} running activities in last 30")
+            _log(logging.INFO, "📊 Found %d running activities in last 30", running_count)
             if last_7_distance > 0 or previous_7_distance > 0:
                 stats['this_week_km'] = round(last_7_distance / 1000, 1)
                 stats['last_week_km'] = round(previous_7_distance / 1000, 1)
-                _log(logging.INFO, f"📊 Mileage stats: Last 7 days={stats['this_week_km']}km, Previous 7 days={stats['last_week_km']}km")
+                _log(logging.INFO, "📊 Mileage stats: Last 7 days=%skm, Previous 7 days=%skm", stats['this_week_km'], stats['last_week_km'])
             else:
                 _log(logging.WARNING, "⚠️  No mileage data found")
         except Exception as e:
-            _log(logging.ERROR, f"❌ Could not fetch mileage data: {e}")
+            _log(logging.ERROR, "❌ Could not fetch mileage data: %s", e)
             if DEV_MODE:
                 traceback.print_exc()
         
@@ -574,11 +818,9 @@ def get_sidebar_stats():
         stats['recovery_emoji'] = None
         
         try:
-            today_str = today.strftime("%Y-%m-%d")
-            
             # Get VO2 Max from training status
             try:
-                status = adapter.client.get_training_status(today_str)
+                status = status_future.result()
                 
                 if status:
                     # VO2 Max is nested: mostRecentVO2Max.generic.vo2MaxPreciseValue
@@ -588,17 +830,17 @@ def get_sidebar_stats():
                     
                     if vo2_value:
                         stats['vo2_max'] = round(vo2_value, 1)
-                        _log(logging.INFO, f"📊 VO2 Max: {stats['vo2_max']}")
+                        _log(logging.INFO, "📊 VO2 Max: %s", stats['vo2_max'])
                     else:
                         _log(logging.WARNING, "⚠️  VO2 Max not available in data")
             except Exception as e:
-                _log(logging.ERROR, f"❌ Could not fetch VO2 max: {e}")
+                _log(logging.ERROR, "❌ Could not fetch VO2 max: %s", e)
                 if DEV_MODE:
                     traceback.print_exc()
             
             # Get recovery status from readiness
             try:
-                readiness_data = adapter.client.get_training_readiness(today_str)
+                readiness_data = readiness_future.result()
                 
                 # API returns a list, get first item (most recent)
                 readiness = None
@@ -623,13 +865,13 @@ def get_sidebar_stats():
                         elif "low" in level or (score and score < 50):
                             stats['recovery_status'] = "poor"
                             stats['recovery_emoji'] = "🔴"
-                        _log(logging.INFO, f"📊 Recovery: {stats['recovery_emoji']} {stats['recovery_status']} (score: {score})")
+                        _log(logging.INFO, "📊 Recovery: %s %s (score: %s)", stats['recovery_emoji'], stats['recovery_status'], score)
             except Exception as e:
-                _log(logging.ERROR, f"❌ Could not fetch recovery status: {e}")
+                _log(logging.ERROR, "❌ Could not fetch recovery status: %s", e)
                 if DEV_MODE:
                     traceback.print_exc()
         except Exception as e:
-            _log(logging.ERROR, f"❌ Could not fetch fitness metrics: {e}")
+            _log(logging.ERROR, "❌ Could not fetch fitness metrics: %s", e)
             if DEV_MODE:
                 traceback.print_exc()
         
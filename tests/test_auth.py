@@ -1,26 +1,44 @@
 #!/usr/bin/env python3
-"""Simple script to test Garmin authentication"""
-from garminconnect import Garmin
+"""Simple script to test Garmin authentication
+
+Credentials are read from GARMIN_EMAIL / GARMIN_PASSWORD (same as GarminAdapter);
+only missing values are prompted for.
+"""
+import os
 from getpass import getpass
 
-print("Testing Garmin Connect Authentication")
-print("=" * 50)
-
-email = input("Enter your Garmin email: ").strip()
-password = getpass("Enter your Garmin password: ")
-
-print("\nAttempting to login...")
-try:
-    client = Garmin(email, password)
-    client.login()
-    print("✓ SUCCESS! Authentication worked.")
-    print(f"✓ Logged in as: {client.get_full_name()}")
-    print("\nYou can now use these credentials in workouts.py")
-except Exception as e:
-    print(f"\n✗ FAILED: {e}")
-    print("\nPossible issues:")
-    print("1. Email or password is incorrect")
-    print("2. 2FA is enabled - you may need to enter the code when prompted")
-    print("3. Account may be locked or require verification")
-    import traceback
-    traceback.print_exc()
+from garminconnect import Garmin
+
+
+def get_credentials():
+    """Resolve credentials up front, prompting only for what is missing."""
+    email = os.environ.get("GARMIN_EMAIL") or input("Enter your Garmin email: ").strip()
+    password = os.environ.get("GARMIN_PASSWORD") or getpass("Enter your Garmin password: ")
+    return email, password
+
+
+def main():
+    print("Testing Garmin Connect Authentication")
+    print("=" * 50)
+
+    email, password = get_credentials()
+
+    print("\nAttempting to login...")
+    try:
+        client = Garmin(email, password)
+        client.login()
+        print("✓ SUCCESS! Authentication worked.")
+        print(f"✓ Logged in as: {client.get_full_name()}")
+        print("\nYou can now use these credentials in workouts.py")
+    except Exception as e:
+        print(f"\n✗ FAILED: {e}")
+        print("\nPossible issues:")
+        print("1. Email or password is incorrect")
+        print("2. 2FA is enabled - you may need to enter the code when prompted")
+        print("3. Account may be locked or require verification")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
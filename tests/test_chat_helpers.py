@@ -0,0 +1,87 @@
+"""
+Unit tests for the pre-rendered chat history markdown and the answer cache.
+Run with: python -m pytest tests/test_chat_helpers.py -v
+"""
+import datetime as dt
+import types
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("httpx")
+
+import chat_helpers
+from chat_helpers import _history_markdown
+
+YOU = chat_helpers._ROLE_LABELS["user"]
+COACH = chat_helpers._ROLE_LABELS["assistant"]
+
+
+class _SessionState(dict):
+    """Dict with attribute access, standing in for st.session_state."""
+
+    __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
+
+
+@pytest.fixture(autouse=True)
+def session_state(monkeypatch):
+    state = _SessionState()
+    monkeypatch.setattr(chat_helpers, "st", types.SimpleNamespace(session_state=state))
+    return state
+
+
+def _msgs(*pairs):
+    return [{"role": role, "content": content} for role, content in pairs]
+
+
+class TestHistoryMarkdown:
+    """Older messages render as one markdown string, grouped by role."""
+
+    def test_alternating_roles(self):
+        text = _history_markdown(_msgs(("user", "Hi"), ("assistant", "Hello")))
+        assert text == f"{YOU}\n\nHi\n\n---\n\n{COACH}\n\nHello\n\n"
+
+    def test_same_role_is_grouped_under_one_label(self):
+        text = _history_markdown(_msgs(("assistant", "One"), ("assistant", "Two"), ("user", "Three")))
+        assert text == f"{COACH}\n\nOne\n\nTwo\n\n---\n\n{YOU}\n\nThree\n\n"
+
+    def test_extends_incrementally(self, session_state):
+        messages = _msgs(("user", "a"), ("assistant", "b"), ("user", "c"))
+        _history_markdown(messages[:2])
+        assert session_state.history_md[0] == 2
+
+        assert _history_markdown(messages) == f"{YOU}\n\na\n\n---\n\n{COACH}\n\nb\n\n---\n\n{YOU}\n\nc\n\n"
+        assert session_state.history_md[0] == 3
+
+    def test_rebuilds_when_history_shrinks(self, session_state):
+        _history_markdown(_msgs(("user", "old"), ("assistant", "older"), ("user", "new")))
+
+        assert _history_markdown(_msgs(("user", "new"))) == f"{YOU}\n\nnew\n\n"
+
+    def test_unknown_role_uses_its_name(self):
+        assert _history_markdown(_msgs(("system", "note"))) == "system\n\nnote\n\n"
+
+
+class TestResponseCache:
+    """Exact-match answers are keyed by day and expire after RESPONSE_CACHE_SECONDS."""
+
+    @pytest.fixture(autouse=True)
+    def chat_state(self, session_state, monkeypatch):
+        monkeypatch.setattr(chat_helpers, "_response_cache", chat_helpers.OrderedDict())
+        session_state.update(user_id="u1", garmin_user="Runner", user_context="{}", messages=[])
+
+    def test_key_changes_with_the_date(self, monkeypatch):
+        today = chat_helpers._response_key("What should I run today?")
+        monkeypatch.setattr(chat_helpers, "date", types.SimpleNamespace(today=lambda: dt.date(2000, 1, 2)))
+
+        assert chat_helpers._response_key("What should I run today?") != today
+
+    def test_entries_expire(self, monkeypatch):
+        clock = [1000.0]
+        monkeypatch.setattr(chat_helpers.time, "monotonic", lambda: clock[0])
+        chat_helpers._store_response("k", "answer")
+        assert chat_helpers._cached_response("k") == "answer"
+
+        clock[0] += chat_helpers.RESPONSE_CACHE_SECONDS
+        assert chat_helpers._cached_response("k") is None
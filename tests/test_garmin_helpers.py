@@ -0,0 +1,173 @@
+"""
+Unit tests for the Garmin response cache, calendar walking and write rate limit.
+Run with: python -m pytest tests/test_garmin_helpers.py -v
+"""
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("garminconnect")
+pytest.importorskip("streamlit")  # garmin/__init__ imports the login helpers
+
+from garmin import cache
+from garmin import adapter as adapter_module
+from garmin.adapter import GarminAdapter, _RateLimiter
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cache, "_last_sweep", {})
+    return tmp_path
+
+
+def _age(path, seconds):
+    """Backdate a file's mtime, which the cache uses as the entry's age."""
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+class TestCache:
+    """get/put/invalidate on the file-backed TTL cache."""
+
+    def test_round_trip(self, cache_dir):
+        cache.put("acct", "stats", {"steps": 1200})
+        assert cache.get("acct", "stats", ttl=60) == {"steps": 1200}
+
+    def test_missing_key_is_miss(self, cache_dir):
+        assert cache.get("acct", "nothing", ttl=60) is cache.MISS
+
+    def test_none_is_a_cacheable_value(self, cache_dir):
+        cache.put("acct", "empty", None)
+        assert cache.get("acct", "empty", ttl=60) is None
+
+    def test_expired_entry_is_miss_and_deleted(self, cache_dir):
+        cache.put("acct", "stats", 1)
+        path = cache._path("acct", "stats")
+        _age(path, 120)
+
+        assert cache.get("acct", "stats", ttl=60) is cache.MISS
+        assert not os.path.exists(path)
+
+    def test_unreadable_entry_is_miss(self, cache_dir):
+        cache.put("acct", "stats", 1)
+        with open(cache._path("acct", "stats"), "w") as f:
+            f.write("{not json")
+
+        assert cache.get("acct", "stats", ttl=60) is cache.MISS
+
+    def test_namespaces_are_separate(self, cache_dir):
+        cache.put("one", "stats", 1)
+        assert cache.get("two", "stats", ttl=60) is cache.MISS
+
+    def test_invalidate_prefix(self, cache_dir):
+        cache.put("acct", "calendar_2024_5", 1)
+        cache.put("acct", "calendar_2024_6", 2)
+        cache.put("acct", "stats", 3)
+
+        cache.invalidate("acct", "calendar_")
+
+        assert cache.get("acct", "calendar_2024_5", ttl=60) is cache.MISS
+        assert cache.get("acct", "calendar_2024_6", ttl=60) is cache.MISS
+        assert cache.get("acct", "stats", ttl=60) == 3
+
+    def test_invalidate_unknown_namespace(self, cache_dir):
+        cache.invalidate("never-written")
+
+    def test_put_sweeps_stale_files(self, cache_dir):
+        cache.put("acct", "stats_2024-01-01", 1)
+        old = cache._path("acct", "stats_2024-01-01")
+        _age(old, cache.MAX_AGE_SECONDS + 60)
+        cache._last_sweep.clear()
+
+        cache.put("acct", "stats_2024-02-01", 2)
+
+        assert not os.path.exists(old)
+        assert cache.get("acct", "stats_2024-02-01", ttl=60) == 2
+
+
+class _CalendarAdapter(GarminAdapter):
+    """Adapter whose month calendars come from a dict instead of Garmin."""
+
+    def __init__(self, calendars):
+        super().__init__(email="runner@example.com", password="secret")
+        self.calendars = calendars
+
+    def _get_calendars(self, months):
+        return [self.calendars[month] for month in months]
+
+
+def _calendar(*days):
+    """One-week month view holding the given (date, [item names]) days."""
+    return {"calendarWeeks": [{"calendarDays": [
+        {"calendarDate": day, "calendarItems": [{"title": name} for name in names]}
+        for day, names in days
+    ]}]}
+
+
+class TestIterCalendarItems:
+    """_iter_calendar_items walks month views without repeating shared days."""
+
+    def test_neighbouring_month_days_are_not_repeated(self):
+        adapter = _CalendarAdapter({
+            (2024, 5): _calendar(("2024-05-31", ["Tempo"]), ("2024-06-01", ["Long run"])),
+            (2024, 6): _calendar(("2024-05-31", ["Tempo"]), ("2024-06-01", ["Long run"]), ("2024-06-02", ["Easy"])),
+        })
+
+        items = [(day, item["title"]) for day, item in adapter._iter_calendar_items([(2024, 5), (2024, 6)])]
+
+        assert items == [("2024-05-31", "Tempo"), ("2024-06-01", "Long run"), ("2024-06-02", "Easy")]
+
+    def test_several_items_on_one_day(self):
+        adapter = _CalendarAdapter({(2024, 6): _calendar(("2024-06-01", ["Race", "Shakeout"]))})
+
+        items = [item["title"] for _, item in adapter._iter_calendar_items([(2024, 6)])]
+
+        assert items == ["Race", "Shakeout"]
+
+    def test_empty_calendar(self):
+        adapter = _CalendarAdapter({(2024, 6): {}})
+        assert list(adapter._iter_calendar_items([(2024, 6)])) == []
+
+
+class TestRateLimiter:
+    """_RateLimiter hands out call slots 1/rate seconds apart."""
+
+    def test_spaces_calls(self, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr(adapter_module.time, "monotonic", lambda: 100.0)
+        monkeypatch.setattr(adapter_module.time, "sleep", sleeps.append)
+        limiter = _RateLimiter(4)
+
+        for _ in range(3):
+            limiter.wait()
+
+        assert sleeps == [0.25, 0.5]
+
+    def test_no_wait_after_idle(self, monkeypatch):
+        clock = [100.0]
+        sleeps = []
+        monkeypatch.setattr(adapter_module.time, "monotonic", lambda: clock[0])
+        monkeypatch.setattr(adapter_module.time, "sleep", sleeps.append)
+        limiter = _RateLimiter(4)
+
+        limiter.wait()
+        clock[0] += 1.0
+        limiter.wait()
+
+        assert sleeps == []
+
+    def test_threads_share_the_limit(self):
+        limiter = _RateLimiter(50)
+        threads = [threading.Thread(target=limiter.wait) for _ in range(6)]
+
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Six calls at 50/s need at least five 20 ms gaps
+        assert time.monotonic() - start >= 5 / 50 - 0.01
@@ -0,0 +1,81 @@
+"""
+Unit tests for truncated tool payloads.
+Run with: python -m pytest tests/test_llm_tools.py -v
+"""
+import contextvars
+from collections import OrderedDict
+
+import pytest
+
+pytest.importorskip("langchain")
+
+import llm_tools
+from llm_tools import _truncate_payload, load_full_payload, use_tool_session
+
+LIMIT = 10
+
+
+@pytest.fixture(autouse=True)
+def small_payloads(monkeypatch):
+    monkeypatch.setattr(llm_tools, "TOOL_OUTPUT_LIMIT", LIMIT)
+    monkeypatch.setattr(llm_tools, "_payloads", OrderedDict())
+
+
+def _as_user(user_id, fn, *args):
+    """Run fn the way a tool call for user_id runs: in a context bound to that user."""
+    def run():
+        use_tool_session(None, user_id)
+        return fn(*args)
+    return contextvars.copy_context().run(run)
+
+
+def _handle(truncated):
+    return truncated.split('handle="', 1)[1].split('"', 1)[0]
+
+
+def _load(user_id, handle, offset):
+    return _as_user(user_id, load_full_payload.invoke, {"handle": handle, "offset": offset})
+
+
+class TestTruncatePayload:
+    """Long results are cut at TOOL_OUTPUT_LIMIT with a handle to the rest."""
+
+    def test_short_text_is_unchanged(self):
+        assert _as_user("u1", _truncate_payload, "short") == "short"
+
+    def test_long_text_is_truncated(self):
+        truncated = _as_user("u1", _truncate_payload, "abcdefghijKLMNOP")
+
+        assert truncated.startswith("abcdefghij\n...[truncated, 16 chars total")
+        assert f"offset={LIMIT}" in truncated
+
+
+class TestLoadFullPayload:
+    """load_full_payload pages through a stored payload for the user it belongs to."""
+
+    def test_pages_through_the_rest(self):
+        text = "0123456789" "ABCDEFGHIJ" "xyz"
+        handle = _handle(_as_user("u1", _truncate_payload, text))
+
+        second = _load("u1", handle, LIMIT)
+        assert second.startswith("ABCDEFGHIJ")
+        assert f"offset={2 * LIMIT}" in second
+        assert _load("u1", handle, 2 * LIMIT) == "xyz"
+
+    def test_other_users_cannot_read_it(self):
+        handle = _handle(_as_user("u1", _truncate_payload, "0123456789secret"))
+
+        assert _load("u2", handle, LIMIT).startswith("Error: No stored payload")
+
+    def test_unknown_handle(self):
+        assert _load("u1", "deadbeef", 0).startswith("Error: No stored payload")
+
+    def test_least_recently_used_payload_is_dropped(self, monkeypatch):
+        monkeypatch.setattr(llm_tools, "PAYLOAD_CACHE_SIZE", 2)
+        first = _handle(_as_user("u1", _truncate_payload, "first-payload-text"))
+        second = _handle(_as_user("u1", _truncate_payload, "second-payload-text"))
+        _load("u1", first, LIMIT)  # Reading it makes it the most recently used
+        _as_user("u1", _truncate_payload, "third-payload-text")
+
+        assert not _load("u1", first, LIMIT).startswith("Error")
+        assert _load("u1", second, LIMIT).startswith("Error")
@@ -0,0 +1,73 @@
+"""
+Unit tests for friendly_error.
+Run with: python -m pytest tests/test_ui_helpers.py -v
+"""
+import pytest
+
+pytest.importorskip("streamlit")
+
+from ui_helpers import _MSG, friendly_error
+
+
+def _foreign_error(module, name):
+    """An exception class that reports itself as module.name, like a library's own."""
+    cls = type(name, (Exception,), {})
+    cls.__module__ = module
+    return cls
+
+
+class TestRulePriority:
+    """String rules apply in _ERROR_RULES order, not by position in the text."""
+
+    def test_single_rule(self):
+        assert friendly_error(Exception("HTTP 429 Too Many Requests")) == _MSG["rate"]
+
+    def test_earlier_rule_wins(self):
+        # "connection" appears first in the text, but the timeout rule comes first
+        assert friendly_error(Exception("connection pool: read timed out")) == _MSG["timeout"]
+
+    def test_unauthorized_beats_everything(self):
+        assert friendly_error(Exception("timeout after 401 Unauthorized")) == _MSG["unauth"]
+
+    def test_case_insensitive(self):
+        assert friendly_error(Exception("MFA REQUIRED")) == _MSG["mfa"]
+
+    def test_matches_across_lines(self):
+        assert friendly_error(Exception("login failed\nstatus: 404")) == _MSG["nf"]
+
+    def test_invalid_code(self):
+        assert friendly_error(Exception("the code you entered is invalid")) == _MSG["code"]
+
+
+class TestTypedErrors:
+    """Known exception classes are mapped before any string matching."""
+
+    def test_builtin_class(self):
+        assert friendly_error(TimeoutError("slow")) == _MSG["timeout"]
+
+    def test_subclass_uses_mro(self):
+        class SlowGarmin(TimeoutError):
+            pass
+
+        assert friendly_error(SlowGarmin("401")) == _MSG["timeout"]
+
+    def test_library_class_by_top_level_package(self):
+        auth_error = _foreign_error("garminconnect.exceptions", "GarminConnectAuthenticationError")
+        assert friendly_error(auth_error("rate limit")) == _MSG["unauth"]
+
+    def test_library_subclass_uses_mro(self):
+        rate_error = _foreign_error("garminconnect", "GarminConnectTooManyRequestsError")
+        subclass = type("Throttled", (rate_error,), {})
+
+        assert friendly_error(subclass("boom")) == _MSG["rate"]
+
+
+class TestFallback:
+    """Unmatched errors show their first line, shortened."""
+
+    def test_first_line(self):
+        assert friendly_error(Exception("Something odd\nTraceback ...")) == "Something odd"
+
+    def test_long_line_is_truncated(self):
+        message = friendly_error(Exception("x" * 150))
+        assert message == "x" * 100 + "..."
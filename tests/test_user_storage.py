@@ -0,0 +1,164 @@
+"""
+Unit tests for the conversation journal in user_storage.
+Run with: python -m pytest tests/test_user_storage.py -v
+"""
+import json
+import os
+
+import pytest
+
+import user_storage
+from user_storage import (
+    append_message_by_id,
+    append_messages_by_id,
+    archive_messages_by_id,
+    load_conversation_by_id,
+    save_conversation_by_id,
+)
+
+USER = "testuser"
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Run every test against an empty user_data/ directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(user_storage, "_journal_lengths", {})
+    return tmp_path / "user_data"
+
+
+def _msg(seq, content, role="user"):
+    return {"role": role, "content": content, "seq": seq}
+
+
+class TestJournalFold:
+    """Loading folds journaled messages into the snapshot."""
+
+    def test_journal_only(self):
+        append_message_by_id(USER, 0, {"role": "assistant", "content": "hi"})
+        append_messages_by_id(USER, [_msg(1, "q"), _msg(2, "a", "assistant")])
+
+        assert [m["content"] for m in load_conversation_by_id(USER)] == ["hi", "q", "a"]
+
+    def test_snapshot_plus_journal(self):
+        save_conversation_by_id(USER, [_msg(0, "one"), _msg(1, "two")])
+        append_message_by_id(USER, 2, {"role": "user", "content": "three"})
+
+        assert [m["seq"] for m in load_conversation_by_id(USER)] == [0, 1, 2]
+
+    def test_entries_already_in_snapshot_are_skipped(self):
+        append_messages_by_id(USER, [_msg(0, "one"), _msg(1, "two")])
+        # Snapshot written while the journal still holds the same entries (e.g. a crash
+        # between the snapshot swap and the journal removal)
+        journal = open(user_storage._journal_path(USER), "rb").read()
+        save_conversation_by_id(USER, [_msg(0, "one"), _msg(1, "two")])
+        with open(user_storage._journal_path(USER), "wb") as f:
+            f.write(journal)
+
+        assert [m["content"] for m in load_conversation_by_id(USER)] == ["one", "two"]
+
+    def test_snapshot_without_seqnos(self, data_dir):
+        """Snapshots from before journaling get seqnos from their position."""
+        data_dir.mkdir()
+        with open(user_storage._conversation_path(USER), "w") as f:
+            json.dump({"messages": [{"role": "user", "content": "old"}]}, f)
+        append_message_by_id(USER, 1, {"role": "assistant", "content": "new"})
+
+        messages = load_conversation_by_id(USER)
+        assert [(m["seq"], m["content"]) for m in messages] == [(0, "old"), (1, "new")]
+
+    def test_torn_last_line_is_ignored(self):
+        append_message_by_id(USER, 0, {"role": "user", "content": "kept"})
+        with open(user_storage._journal_path(USER), "ab") as f:
+            f.write(b'{"role": "assistant", "cont')
+
+        assert [m["content"] for m in load_conversation_by_id(USER)] == ["kept"]
+
+    def test_snapshot_removes_journal(self):
+        append_message_by_id(USER, 0, {"role": "user", "content": "x"})
+        save_conversation_by_id(USER, load_conversation_by_id(USER))
+
+        assert not os.path.exists(user_storage._journal_path(USER))
+
+
+class TestArchiveReplay:
+    """archived_upto markers drop archived messages on every load."""
+
+    def test_archived_messages_are_dropped(self):
+        messages = [_msg(i, f"m{i}") for i in range(4)]
+        append_messages_by_id(USER, messages)
+        archive_messages_by_id(USER, messages[:2])
+
+        assert [m["seq"] for m in load_conversation_by_id(USER)] == [2, 3]
+
+    def test_marker_applies_to_snapshot_messages(self):
+        save_conversation_by_id(USER, [_msg(i, f"m{i}") for i in range(3)])
+        archive_messages_by_id(USER, [_msg(0, "m0"), _msg(1, "m1")])
+        append_message_by_id(USER, 3, {"role": "user", "content": "m3"})
+
+        assert [m["seq"] for m in load_conversation_by_id(USER)] == [2, 3]
+
+    def test_replaying_marker_is_harmless(self):
+        messages = [_msg(i, f"m{i}") for i in range(3)]
+        append_messages_by_id(USER, messages)
+        archive_messages_by_id(USER, messages[:1])
+        # The same marker again (e.g. after a reload) must not drop anything further
+        user_storage._append_journal(USER, {"archived_upto": 0})
+
+        assert [m["seq"] for m in load_conversation_by_id(USER)] == [1, 2]
+
+    def test_archive_is_searchable(self):
+        archive_messages_by_id(USER, [_msg(0, "My knee hurts"), _msg(1, "Rest it", "assistant")])
+
+        matches = user_storage.search_archived_messages(USER, "knee")
+        assert len(matches) == 1 and "My knee hurts" in matches[0]
+
+
+class TestCompaction:
+    """Every JOURNAL_COMPACT_EVERY entries the journal is folded into the snapshot."""
+
+    @pytest.fixture(autouse=True)
+    def small_journal(self, monkeypatch):
+        monkeypatch.setattr(user_storage, "JOURNAL_COMPACT_EVERY", 3)
+
+    def test_compacts_into_snapshot(self):
+        for i in range(3):
+            append_message_by_id(USER, i, {"role": "user", "content": f"m{i}"})
+
+        assert not os.path.exists(user_storage._journal_path(USER))
+        assert [m["seq"] for m in load_conversation_by_id(USER)] == [0, 1, 2]
+
+    def test_compaction_keeps_archive_markers_applied(self):
+        messages = [_msg(i, f"m{i}") for i in range(2)]
+        append_messages_by_id(USER, messages)
+        archive_messages_by_id(USER, messages[:1])
+
+        assert not os.path.exists(user_storage._journal_path(USER))
+        assert [m["seq"] for m in load_conversation_by_id(USER)] == [1]
+
+    def test_counts_entries_left_by_an_earlier_process(self):
+        append_messages_by_id(USER, [_msg(0, "a"), _msg(1, "b")])
+        user_storage._journal_lengths.clear()
+        append_message_by_id(USER, 2, {"role": "user", "content": "c"})
+
+        assert not os.path.exists(user_storage._journal_path(USER))
+
+    def test_unreadable_journal_is_not_compacted_away(self):
+        append_message_by_id(USER, 0, {"role": "user", "content": "keep me"})
+        with open(user_storage._journal_path(USER), "ab") as f:
+            f.write(b'{"role": "user", "content": "no seq"}\n')
+        append_message_by_id(USER, 1, {"role": "user", "content": "and me"})
+
+        journal = open(user_storage._journal_path(USER), "rb").read()
+        assert b"keep me" in journal and b"and me" in journal
+        assert not os.path.exists(user_storage._conversation_path(USER))
+
+    def test_corrupt_snapshot_is_not_overwritten(self, data_dir):
+        data_dir.mkdir()
+        with open(user_storage._conversation_path(USER), "w") as f:
+            f.write("{not json")
+        for i in range(3):
+            append_message_by_id(USER, i, {"role": "user", "content": f"m{i}"})
+
+        assert open(user_storage._conversation_path(USER)).read() == "{not json"
+        assert os.path.exists(user_storage._journal_path(USER))
@@ -1,51 +1,103 @@
 """UI helpers for the Garmin AI Running Coach."""
 import logging
 import os
+import re
 import traceback
-from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import date, timedelta
+from functools import partial
 
 import streamlit as st
 
-from config import DEV_MODE
+from config import DEV_MODE, dev_log
 
 logger = logging.getLogger(__name__)
+_log = partial(dev_log, logger)
 
 
-def _log(level, message):
-    if DEV_MODE:
-        logger.log(level, message)
+_CSS_SOURCE = """
+<style>
+    /* Main content text */
+    .stMarkdown, .stText, p, li {
+        font-size: 1.1rem !important;
+    }
+    
+    /* Chat messages */
+    .stChatMessage p {
+        font-size: 1.15rem !important;
+        line-height: 1.6 !important;
+    }
+    
+    /* Input fields */
+    .stTextInput input, .stTextArea textarea {
+        font-size: 1.1rem !important;
+    }
+    
+    /* Buttons */
+    .stButton button {
+        font-size: 1.1rem !important;
+    }
+</style>
+"""
+# Minified once at import: drop comments and whitespace so each rerun ships a smaller element
+_CSS = re.sub(r"\s*([{};,])\s*", r"\1", re.sub(r"\s+", " ", re.sub(r"/\*.*?\*/", "", _CSS_SOURCE, flags=re.S))).strip()
+
+
+def inject_css():
+    """Emit the app stylesheet (must run every rerun - un-emitted elements are dropped)."""
+    st.markdown(_CSS, unsafe_allow_html=True)
+
+
+# (group, pattern, message) in priority order - the first rule that matches wins
+_ERROR_RULES = (
+    ("unauth", r"401|unauthorized", "Invalid email or password. Please check your credentials."),
+    ("mfa", r"mfa|2fa", "Two-factor authentication required."),
+    ("timeout", r"timeout|timed out", "Connection timed out. Please try again."),
+    ("dns", r"name resolution|failed to resolve", "Network error. Please check your internet connection and try again."),
+    ("conn", r"connection", "Network error. Please check your internet connection."),
+    ("rate", r"rate limit|429", "Too many requests. Please wait a moment and try again."),
+    ("nf", r"404", "Service temporarily unavailable. Please try again later."),
+    ("oai", r"openai|api_key", "OpenAI API key is invalid or missing."),
+    ("code", r"invalid.*?code|code.*?invalid", "Invalid 2FA code. Please check and try again."),
+)
+# Anchored lookaheads keep the rule order: a plain alternation would pick whichever
+# token appears first in the text, not the highest-priority rule.
+_ERR_RE = re.compile(
+    r"\A(?:" + "|".join(f"(?=.*?(?:{pattern}))(?P<{name}>)" for name, pattern, _ in _ERROR_RULES) + ")",
+    re.IGNORECASE | re.DOTALL,
+)
+_MSG = {name: message for name, _, message in _ERROR_RULES}
+
+
+# Typed errors resolved by class (walking the MRO) before any string matching. Keyed by
+# "package.ClassName" so the heavy libraries never need importing here.
+_TYPE_MSG = {
+    "garmin.MFARequiredError": _MSG["mfa"],
+    "garminconnect.GarminConnectAuthenticationError": _MSG["unauth"],
+    "garminconnect.GarminConnectTooManyRequestsError": _MSG["rate"],
+    "builtins.TimeoutError": _MSG["timeout"],
+    "requests.Timeout": _MSG["timeout"],
+    "openai.AuthenticationError": _MSG["oai"],
+    "openai.RateLimitError": _MSG["rate"],
+}
 
 
 def friendly_error(error):
     """Map technical errors to short, user-facing messages."""
-    error_str = str(error).lower()
-    
-    if "401" in error_str or "unauthorized" in error_str:
-        return "Invalid email or password. Please check your credentials."
-    elif "mfa" in error_str or "2fa" in error_str:
-        return "Two-factor authentication required."
-    elif "timeout" in error_str or "timed out" in error_str:
-        return "Connection timed out. Please try again."
-    elif "name resolution" in error_str or "failed to resolve" in error_str:
-        return "Network error. Please check your internet connection and try again."
-    elif "connectionerror" in error_str or "connection" in error_str:
-        return "Network error. Please check your internet connection."
-    elif "rate limit" in error_str or "429" in error_str:
-        return "Too many requests. Please wait a moment and try again."
-    elif "404" in error_str:
-        return "Service temporarily unavailable. Please try again later."
-    elif "openai" in error_str or "api_key" in error_str:
-        return "OpenAI API key is invalid or missing."
-    elif "invalid" in error_str and "code" in error_str:
-        return "Invalid 2FA code. Please check and try again."
-    first_line = str(error).split('\n')[0]
+    for cls in type(error).__mro__:
+        message = _TYPE_MSG.get(f"{cls.__module__.partition('.')[0]}.{cls.__qualname__}")
+        if message:
+            return message
+    text = str(error)
+    match = _ERR_RE.match(text)
+    if match:
+        return _MSG[match.lastgroup]
+    first_line = text.split('\n', 1)[0]
     if len(first_line) > 100:
         return first_line[:100] + "..."
     return first_line
 
 
-def render_sidebar(get_sidebar_stats_fn, on_logout):
+def render_sidebar(get_sidebar_stats_fn, on_logout, on_refresh=None):
     """Render the sidebar and return whether an API key is available."""
     with st.sidebar:
         if not os.environ.get("OPENAI_API_KEY"):
@@ -67,11 +119,13 @@ def render_sidebar(get_sidebar_stats_fn, on_logout):
                 stats = get_sidebar_stats_fn()
                 render_sidebar_stats(stats)
             except Exception as e:
-                _log(logging.ERROR, f"❌ Sidebar stats error: {e}")
+                _log(logging.ERROR, "❌ Sidebar stats error: %s", e)
                 if DEV_MODE:
                     traceback.print_exc()
 
             st.markdown("---")
+            if on_refresh and st.button("🔄 Refresh Garmin data", use_container_width=True):
+                on_refresh()
             if st.button("🗑️ Logout", use_container_width=True):
                 on_logout()
 
@@ -127,44 +181,53 @@ def render_sidebar_stats(stats):
         st.metric(f"{stats['recovery_emoji']} Recovery", status_text)
 
 
+def _calendar_weeks(adapter, days_ahead):
+    """
+    Scheduled workouts grouped by week, built in one pass.
+
+    Returns {week_start "YYYY-MM-DD": {date "YYYY-MM-DD": workout}}. Not cached here: the
+    adapter's calendar cache already covers the fetch and is dropped whenever a workout
+    is scheduled or deleted, so a new plan shows up straight away.
+    """
+    weeks = {}
+    for workout in adapter.fetch_calendar_workouts(days_ahead=days_ahead):
+        workout_date = date.fromisoformat(workout['date'])
+        week_key = (workout_date - timedelta(days=workout_date.weekday())).isoformat()
+        weeks.setdefault(week_key, {})[workout['date']] = workout
+    return weeks
+
+
 def render_calendar_tab(adapter):
     """Render the calendar tab showing scheduled workouts."""
     st.markdown("### 📅 Upcoming Workouts")
     st.markdown("View your scheduled workouts for the next 2 weeks")
     
     try:
-        workouts = adapter.fetch_calendar_workouts(days_ahead=14)
+        weeks = _calendar_weeks(adapter, 14)
         
-        if not workouts:
+        if not weeks:
             st.info("🏃 No workouts scheduled for the next 2 weeks. Ask the coach to create a training plan!")
         else:
-            weeks = defaultdict(list)
-            
-            for workout in workouts:
-                workout_date = datetime.strptime(workout['date'], "%Y-%m-%d")
-                week_start = workout_date - timedelta(days=workout_date.weekday())
-                week_key = week_start.strftime("%Y-%m-%d")
-                weeks[week_key].append(workout)
-            
+            today = date.today()
             for week_start_str in sorted(weeks.keys()):
-                week_start = datetime.strptime(week_start_str, "%Y-%m-%d")
+                week_start = date.fromisoformat(week_start_str)
                 week_end = week_start + timedelta(days=6)
                 
                 st.markdown(f"#### Week of {week_start.strftime('%b %d')} - {week_end.strftime('%b %d')}")
                 
                 cols = st.columns(7)
                 
-                week_workouts = {w['date']: w for w in weeks[week_start_str]}
+                week_workouts = weeks[week_start_str]
                 
                 for i in range(7):
                     day_date = week_start + timedelta(days=i)
-                    day_str = day_date.strftime("%Y-%m-%d")
+                    day_str = day_date.isoformat()
                     
                     with cols[i]:
                         day_name = day_date.strftime("%a")
                         day_num = day_date.strftime("%d")
                         
-                        if day_date.date() == datetime.now().date():
+                        if day_date == today:
                             st.markdown(f"**{day_name}**  \n**{day_num}** 📍")
                         else:
                             st.markdown(f"{day_name}  \n{day_num}")
@@ -183,6 +246,6 @@ def render_calendar_tab(adapter):
     
     except Exception as e:
         st.warning("Unable to load calendar. Please try again later.")
-        _log(logging.ERROR, f"❌ Calendar error: {e}")
+        _log(logging.ERROR, "❌ Calendar error: %s", e)
         if DEV_MODE:
             traceback.print_exc()
@@ -13,16 +13,19 @@ import json
 import logging
 import os
 import hashlib
+import threading
 from datetime import datetime
-from typing import Optional, List, Dict
-from config import DEV_MODE
-
-logger = logging.getLogger(__name__)
+from functools import partial
+from typing import Optional, List, Dict, Tuple
+from config import dev_log
 
+try:
+    import orjson
+except ImportError:  # Optional speedup - fall back to the stdlib json module
+    orjson = None
 
-def _log(level, message):
-    if DEV_MODE:
-        logger.log(level, message)
+logger = logging.getLogger(__name__)
+_log = partial(dev_log, logger)
 
 
 DATA_DIR = "user_data"
@@ -77,8 +80,16 @@ def load_conversation(email: str, password: str) -> List[Dict]:
     return load_conversation_by_id(user_id)
 
 
+def _conversation_path(user_id: str) -> str:
+    return f"user_data/{user_id}_conversation.json"
+
+
+def _journal_path(user_id: str) -> str:
+    return f"user_data/{user_id}_conversation.jsonl"
+
+
 def save_conversation_by_id(user_id: str, messages: List[Dict]):
-    """Save chat history by user_id directly."""
+    """Save chat history by user_id directly (a full snapshot - the journal is folded in)."""
     ensure_data_dir()
     
     data = {
@@ -87,24 +98,150 @@ def save_conversation_by_id(user_id: str, messages: List[Dict]):
         "messages": messages
     }
     
-    filepath = f"user_data/{user_id}_conversation.json"
-    with open(filepath, "w") as f:
-        json.dump(data, f, indent=2)
+    filepath = _conversation_path(user_id)
+    # Write to a temp file and swap it in, so a crash mid-write never leaves a truncated file
+    tmp_path = f"{filepath}.tmp"
+    with _write_lock:
+        if orjson is not None:
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+        else:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+        os.replace(tmp_path, filepath)
+        # The snapshot now holds everything the journal did
+        if os.path.exists(_journal_path(user_id)):
+            os.remove(_journal_path(user_id))
+        _journal_lengths[user_id] = 0
+
+
+# --- Conversation journal ---
+# Each chat turn appends only its new message to a JSON-lines journal instead of rewriting
+# the whole conversation. Loading folds the journal into the snapshot; every
+# JOURNAL_COMPACT_EVERY entries the two are compacted back into a single snapshot.
+JOURNAL_COMPACT_EVERY = 50
+_journal_lengths: Dict[str, int] = {}
+# Serializes snapshot/journal writes; re-entrant because compaction saves a snapshot
+_write_lock = threading.RLock()
+
+
+def _append_journal(user_id: str, *entries: Dict):
+    ensure_data_dir()
+    if orjson is not None:
+        lines = b"".join(orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE) for entry in entries)
+    else:
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries).encode()
+    with _write_lock:
+        with open(_journal_path(user_id), "ab") as f:
+            f.write(lines)
+        length = _journal_lengths.get(user_id)
+        if length is None:
+            # First append in this process - count what earlier runs left behind
+            with open(_journal_path(user_id), "rb") as f:
+                length = f.read().count(b"\n")
+        else:
+            length += len(entries)
+        _journal_lengths[user_id] = length
+        if length >= JOURNAL_COMPACT_EVERY:
+            try:
+                messages = _load_conversation(user_id)
+            except Exception as e:
+                # Compacting would replace the history with whatever loaded - keep the journal
+                _log(logging.ERROR, "Skipping journal compaction: %s", e)
+            else:
+                save_conversation_by_id(user_id, messages)
+
+
+def append_message_by_id(user_id: str, seq: int, msg: Dict):
+    """Journal a single new message; seq must increase with every message."""
+    _append_journal(user_id, {**msg, "seq": seq})
+
+
+def append_messages_by_id(user_id: str, messages: List[Dict]):
+    """Journal several messages (each carrying its seq) in a single write."""
+    _append_journal(user_id, *messages)
+
+
+def _read_journal(user_id: str) -> List[Dict]:
+    filepath = _journal_path(user_id)
+    if not os.path.exists(filepath):
+        return []
+    entries = []
+    with open(filepath, "rb") as f:
+        for line in f:
+            try:
+                entries.append(orjson.loads(line) if orjson is not None else json.loads(line))
+            except ValueError:
+                # A crash mid-append can leave a torn last line
+                continue
+    return entries
+
+
+def _load_conversation(user_id: str) -> List[Dict]:
+    """Snapshot plus journaled messages; raises if either can't be read."""
+    filepath = _conversation_path(user_id)
+    messages = []
+    if os.path.exists(filepath):
+        with open(filepath, "rb") as f:
+            raw = f.read()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        messages = data.get("messages", [])
+    # Snapshots written before journaling have no seqnos
+    for i, msg in enumerate(messages):
+        msg.setdefault("seq", i)
+    last_seq = messages[-1]["seq"] if messages else -1
+    for entry in _read_journal(user_id):
+        if "archived_upto" in entry:
+            messages = [msg for msg in messages if msg["seq"] > entry["archived_upto"]]
+        elif entry["seq"] > last_seq:  # Skip entries the snapshot already holds
+            messages.append(entry)
+            last_seq = entry["seq"]
+    return messages
 
 
 def load_conversation_by_id(user_id: str) -> List[Dict]:
-    """Load previous chat history by user_id directly."""
-    filepath = f"user_data/{user_id}_conversation.json"
-    
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, "r") as f:
-                data = json.load(f)
-                return data.get("messages", [])
-        except Exception as e:
-            _log(logging.ERROR, f"Error loading conversation: {e}")
-            return []
-    return []
+    """Load previous chat history by user_id directly (snapshot plus journaled messages)."""
+    try:
+        return _load_conversation(user_id)
+    except Exception as e:
+        _log(logging.ERROR, "Error loading conversation: %s", e)
+        return []
+
+
+# --- Conversation Archive (older messages moved out of the live chat) ---
+
+# Separates archived messages; an HTML comment so it can't clash with markdown in replies
+_ARCHIVE_MARKER = "<!-- message -->"
+
+
+def archive_messages_by_id(user_id: str, messages: List[Dict]):
+    """Move messages out of the live conversation into the user's markdown archive."""
+    if not messages:
+        return
+    ensure_data_dir()
+    archived_at = datetime.now().isoformat(timespec="seconds")
+    blocks = [f"{_ARCHIVE_MARKER}\n**{msg['role']}** ({archived_at})\n\n{msg['content']}\n\n" for msg in messages]
+    with open(f"user_data/{user_id}_history.md", "a", encoding="utf-8") as f:
+        f.write("".join(blocks))
+    if "seq" in messages[-1]:
+        # Keyed by seqno rather than a count so replaying it is harmless
+        _append_journal(user_id, {"archived_upto": messages[-1]["seq"]})
+
+
+def search_archived_messages(user_id: str, query: str, limit: int = 5) -> List[str]:
+    """Return the most recent archived messages containing every word of the query."""
+    filepath = f"user_data/{user_id}_history.md"
+    terms = query.lower().split()
+    if not terms or not os.path.exists(filepath):
+        return []
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            blocks = f.read().split(_ARCHIVE_MARKER)
+    except Exception as e:
+        _log(logging.ERROR, "Error reading conversation archive: %s", e)
+        return []
+    matches = [b.strip() for b in blocks if b.strip() and all(term in b.lower() for term in terms)]
+    return matches[-limit:]
 
 
 # --- Garmin Token Storage ---
@@ -114,8 +251,12 @@ def save_garmin_token(email: str, password: str, token_data: str, username: str
     Save Garmin OAuth tokens and username for persistent login.
     token_data should be the base64 string from garth.dumps().
     """
+    save_garmin_token_by_id(get_user_id(email, password), token_data, username=username)
+
+
+def save_garmin_token_by_id(user_id: str, token_data: str, username: str = None):
+    """Save Garmin OAuth tokens and username by user_id directly (e.g. after a token refresh)."""
     ensure_data_dir()
-    user_id = get_user_id(email, password)
     
     data = {
         "user_id": user_id,
@@ -125,8 +266,11 @@ def save_garmin_token(email: str, password: str, token_data: str, username: str
     }
     
     filepath = f"user_data/{user_id}_garmin_token.json"
-    with open(filepath, "w") as f:
+    # Temp file + swap: a crash mid-write must not destroy the only saved login
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "w") as f:
         json.dump(data, f, indent=2)
+    os.replace(tmp_path, filepath)
 
 
 def load_garmin_token(email: str, password: str) -> Optional[str]:
@@ -145,11 +289,25 @@ def load_garmin_token_by_id(user_id: str) -> Optional[str]:
                 data = json.load(f)
                 return data.get("tokens")
         except Exception as e:
-            _log(logging.ERROR, f"Error loading token: {e}")
+            _log(logging.ERROR, "Error loading token: %s", e)
             return None
     return None
 
 
+def load_garmin_session_by_id(user_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """Load saved (tokens, username) by user_id with a single read of the token file."""
+    filepath = f"user_data/{user_id}_garmin_token.json"
+    
+    if os.path.exists(filepath):
+        try:
+            with open(filepath, "r") as f:
+                data = json.load(f)
+                return data.get("tokens"), data.get("username")
+        except Exception as e:
+            _log(logging.ERROR, "Error loading token: %s", e)
+    return None, None
+
+
 def load_garmin_username_by_id(user_id: str) -> Optional[str]:
     """Load saved username by user_id directly."""
     filepath = f"user_data/{user_id}_garmin_token.json"